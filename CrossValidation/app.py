@@ -12,12 +12,12 @@
     limitations under the License.
 """
 from CustomStates import ConfigState
+from CustomStates.Profiler import instrument
 from FeatureCloud.app.engine.app import app_state, Role, AppState, LogLevel
 from FeatureCloud.app.engine.app import State as op_state
-import pandas as pd
-from sklearn.model_selection import StratifiedKFold, KFold
 import os
-from utils import save_numpy, load_numpy, sep_feat_from_label
+from utils import load_numpy, sep_feat_from_label, read_csv
+from .utils import write_folds, fold_assignments, fold_indices, save_fold_assignments, CV_TYPES
 
 name = 'cross_validation'
 
@@ -35,27 +35,68 @@ class LoadAndSplit(ConfigState.State):
         self.store('format', self.config['local_dataset']['data'].lower().split(".")[-1].strip())
         self.store('sep', self.config['local_dataset']['sep'].strip())
         self.store('target', self.config['local_dataset']['target_value'].strip())
-        df = self.read_data()
+        # `n_jobs` in `logic` is shared by all apps; the top-level option is kept for older config files
+        self.store('n_jobs', (self.config.get('logic', None) or {}).get('n_jobs', None) or self.config.get('n_jobs', 1))
+        cv_type = self.config.get('cv_type', None) or ('stratified' if self.config['stratify'] else 'kfold')
+        if cv_type not in CV_TYPES:
+            self.log(f"{cv_type} is not supported; supported CV types: {', '.join(CV_TYPES)}", LogLevel.ERROR)
+            self.update(state=op_state.ERROR)
+        self.store('cv_type', cv_type)
+        folds_file = self.load('output_files').get('folds', [None])[0]
         # Creat placeholders for output files
         output_folder = f"{self.output_dir}/{self.config['split_dir']}"
-        train, test = [], []
-        for i in range(self.config['n_splits']):
-            os.makedirs(f"{output_folder}/{i}")
-            train.append(f"{output_folder}/{i}/{self.config['result']['train']}")
-            test.append(f"{output_folder}/{i}/{self.config['result']['test']}")
-        self.store('output_files', {'train': train, 'test': test})
+        write_splits = self.config.get('write_splits', True)
+        n_folds = self.config['n_splits'] * self.config.get('n_repeats', 1) if write_splits else 0
+        train = [f"{output_folder}/{i}/{self.config['result']['train']}" for i in range(n_folds)]
+        test = [f"{output_folder}/{i}/{self.config['result']['test']}" for i in range(n_folds)]
+        outputs = train + test + ([folds_file] if folds_file is not None else [])
+        manifest = self.load('manifest')
+        # The number of processes and the resume option do not change the splits
+        options = {k: v for k, v in self.config.items() if k not in ['n_jobs', 'logic']}
+        logic = self.config.get('logic', None) or {}
+        options['logic'] = {k: v for k, v in logic.items() if k not in ['n_jobs', 'resume']}
+        fingerprint = manifest.fingerprint(self.data_files(), options)
+        self.store('cache_entry', ('folds', fingerprint, outputs))
+        if manifest.lookup('folds', fingerprint) is not None:
+            self.log("Splits are up to date; nothing will be rewritten")
+            self.store('output_files', {'train': [], 'test': []})
+            self.store('data', None)
+            self.store('splits', [])
+            return 'WriteResults'
+        df = self.read_data()
         self.update(progress=0.1)
-        self.store('splits', self.create_splits(df))
+        self.store('data', df)
+        assignments = self.create_splits(df, cv_type)
+        if folds_file is not None:
+            save_fold_assignments(folds_file, assignments, self.config['n_splits'], cv_type)
+        self.update(progress=0.3)
+        splits = []
+        for r, assignment in enumerate(assignments if write_splits else []):
+            for fold in range(self.config['n_splits']):
+                os.makedirs(os.path.dirname(train[r * self.config['n_splits'] + fold]), exist_ok=True)
+                splits.append(fold_indices(assignment, fold, cv_type))
+        self.store('output_files', {'train': train, 'test': test})
+        self.store('splits', splits)
         self.update(progress=0.5)
         return 'WriteResults'
 
+    def data_files(self):
+        """ Input files that the splits are created from, i.e., the data file and, if any, the labels file.
+        """
+        file_name = self.load('input_files')['data'][0]
+        target = self.config['local_dataset'].get('target_value', None) or ''
+        if self.load('format') in ["npy", "npz"] and ('.npy' in target or '.npz' in target):
+            return [file_name, os.path.join(os.path.dirname(file_name), target)]
+        return [file_name]
+
     def read_data(self):
         file_name = self.load('input_files')['data'][0]
         format = self.load('format')
         if format in ["npy", "npz"]:
             df = self.load_numpy_files(file_name)
         elif format in ["csv", "txt"]:
-            df = pd.read_csv(file_name, sep=self.config['local_dataset']['sep'])
+            df = read_csv(file_name, sep=self.config['local_dataset']['sep'],
+                          **(self.config['local_dataset'].get('reader', None) or {}))
         else:
             self.app.log(f"{format} file types are not supported", LogLevel.ERROR)
             self.update(state=op_state.ERROR)
@@ -75,52 +116,53 @@ class LoadAndSplit(ConfigState.State):
                          "key in config file", LogLevel.ERROR)
             self.update(state=op_state.ERROR)
 
-    def create_splits(self, data):
-        splits = []
-        if self.config['stratify'] and (self.config['local_dataset']['target_value'] is not None):
-            self.log(f'Use stratified kfold cv for label column', LogLevel.DEBUG)
-            cv = StratifiedKFold(n_splits=self.config['n_splits'], shuffle=self.config['shuffle'],
-                                 random_state=self.config['random_state'])
-            y = data.loc[:, self.config['local_dataset']['target_value']]
-            data = data.drop(self.config['local_dataset']['target_value'], axis=1)
-            for train_indices, test_indices in cv.split(data, y):
-                train_df = pd.DataFrame(data.iloc[train_indices], columns=data.columns)
-                test_df = pd.DataFrame(data.iloc[test_indices], columns=data.columns)
-                splits.append([train_df, test_df])
-        else:
-            self.log(f'Use kfold cv', LogLevel.DEBUG)
-            cv = KFold(n_splits=self.config['n_splits'], shuffle=self.config['shuffle'],
-                       random_state=self.config['random_state'])
-            for train_indices, test_indices in cv.split(data):
-                train_df = pd.DataFrame(data.iloc[train_indices], columns=data.columns)
-                test_df = pd.DataFrame(data.iloc[test_indices], columns=data.columns)
-                splits.append([train_df, test_df])
-        return splits
+    def create_splits(self, data, cv_type):
+        """ Assigns samples to test folds for all repeats in one call; no data is copied.
+
+        Parameters
+        ----------
+        data: pandas.DataFrame
+        cv_type: str
+
+        Returns
+        -------
+        numpy.array
+            int32 array of (n_repeats, n_samples) shape including the test fold of each sample
+        """
+        y, groups = None, None
+        if 'stratified' in cv_type:
+            target = self.config['local_dataset']['target_value']
+            y = data.loc[:, target if target in data.columns else 'label']
+        if 'group' in cv_type:
+            groups = data.loc[:, self.config['group_column']]
+        self.log(f'Use {cv_type} cv', LogLevel.DEBUG)
+        try:
+            return fold_assignments(len(data), self.config['n_splits'], cv_type, y=y, groups=groups,
+                                    n_repeats=self.config.get('n_repeats', 1), shuffle=self.config['shuffle'],
+                                    random_state=self.config['random_state'])
+        except ValueError as e:
+            self.log(f"Splits cannot be created:\n{e}", LogLevel.ERROR)
+            self.update(state=op_state.ERROR)
+            raise
 
 
 @app_state(name='WriteResults', role=Role.BOTH)
+@instrument
 class WriteResults(AppState):
     def register(self):
         self.register_transition('terminal', Role.BOTH)
 
     def run(self) -> str or None:
-        files = zip(self.load('splits'),
-                    self.load('output_files')['train'],
-                    self.load('output_files')['test'])
-        print(files)
-        csv_writer = lambda filename, df: df.to_csv(filename, sep=self.load('sep'), index=False)
-        np_lambda = lambda filename, df: save_numpy(filename,
-                                                    df.iloc[:, 0].to_numpy(),
-                                                    df.iloc[:, 1].to_numpy(),
-                                                    self.load('target'))
-        save = {"npy": np_lambda, "npz": np_lambda, "csv": csv_writer, "txt": csv_writer}
-        progress = 0.5
-        step = 0.4 / len(self.load('splits'))
-        for [train_split, test_split], train_filename, test_filename in files:
-            print(train_filename, test_filename)
-            save[self.load('format')](train_filename, train_split)
-            save[self.load('format')](test_filename, test_split)
-            progress += step
-            self.update(progress=progress)
+        write_folds(data=self.load('data'),
+                    folds=self.load('splits'),
+                    train_files=self.load('output_files')['train'],
+                    test_files=self.load('output_files')['test'],
+                    format=self.load('format'),
+                    sep=self.load('sep'),
+                    target=self.load('target'),
+                    n_jobs=self.load('n_jobs'),
+                    progress=lambda done: self.update(progress=0.5 + 0.4 * done))
+        key, fingerprint, outputs = self.load('cache_entry')
+        self.load('manifest').record(key, fingerprint, outputs=outputs)
         self.update(progress=1.0)
         return 'terminal'
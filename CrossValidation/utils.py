@@ -0,0 +1,240 @@
+"""
+    FeatureCloud Cross Validation Application
+    Copyright 2021 Mohammad Bakhtiari, Julian Spath. All Rights Reserved.
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+        http://www.apache.org/licenses/LICENSE-2.0
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from utils import save_numpy, write_csv, in_memory
+
+CV_TYPES = ['kfold', 'stratified', 'repeated_stratified', 'group', 'stratified_group', 'time_series']
+
+# Dataset shared with worker processes; forked workers inherit it copy-on-write, instead of receiving a copy
+_dataset = {}
+
+
+def write_split(data, indices, filename, format, sep, target):
+    """ Slices the samples of a single train or test split and writes them into the file.
+
+    Parameters
+    ----------
+    data: pandas.DataFrame
+    indices: numpy.array
+        positional indices of the samples
+    filename: str
+    format: str
+        extension of the file: `csv`, `txt`, `npy`, or `npz`
+    sep: str
+    target: str
+
+    """
+    split = data.iloc[indices]
+    if format in ["npy", "npz"]:
+        save_numpy(filename, split.iloc[:, 0].to_numpy(), split.iloc[:, 1].to_numpy(), target)
+    else:
+        write_csv(split, filename, sep)
+
+
+def write_fold(train_indices, test_indices, train_filename, test_filename, data=None, **kwargs):
+    """ Writes train and test splits of a single fold.
+        Without `data`, the dataset of the worker process will be used.
+    """
+    if data is None:
+        data, kwargs = _dataset['data'], _dataset['kwargs']
+    write_split(data, train_indices, train_filename, **kwargs)
+    write_split(data, test_indices, test_filename, **kwargs)
+
+
+def _init_worker(data, kwargs):
+    _dataset['data'] = data
+    _dataset['kwargs'] = kwargs
+
+
+def write_folds(data, folds, train_files, test_files, format, sep, target, n_jobs=1, progress=None):
+    """ Writes all folds, one after another or in parallel with a pool of processes.
+        Only index arrays of folds are kept; samples are sliced once the fold is written.
+
+    Parameters
+    ----------
+    data: pandas.DataFrame
+    folds: list
+        list of [train_indices, test_indices]
+    train_files: list
+    test_files: list
+    format: str
+    sep: str
+    target: str
+    n_jobs: int
+        number of processes; if one, folds are written in the current process.
+    progress: callable
+        will be called with the fraction of written folds
+
+    """
+    kwargs = {'format': format, 'sep': sep, 'target': target}
+    jobs = [(train, test, train_file, test_file)
+            for (train, test), train_file, test_file in zip(folds, train_files, test_files)]
+    # Worker processes cannot hand outputs that are kept in memory to the next app
+    if n_jobs is None or int(n_jobs) <= 1 or in_memory():
+        for i, job in enumerate(jobs):
+            write_fold(*job, data=data, **kwargs)
+            if progress is not None:
+                progress((i + 1) / len(jobs))
+        return
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # Set before workers are forked, so that they share the dataset with this process
+        _init_worker(data, kwargs)
+        pool = ProcessPoolExecutor(max_workers=int(n_jobs), mp_context=multiprocessing.get_context('fork'))
+    else:
+        # Without fork, e.g., on Windows, each worker receives a copy of the dataset once
+        pool = ProcessPoolExecutor(max_workers=int(n_jobs), initializer=_init_worker, initargs=(data, kwargs))
+    try:
+        with pool as ex:
+            futures = [ex.submit(write_fold, *job) for job in jobs]
+            for i, future in enumerate(as_completed(futures)):
+                future.result()
+                if progress is not None:
+                    progress((i + 1) / len(jobs))
+    finally:
+        _dataset.clear()
+
+
+def fold_assignments(n_samples, n_splits, cv_type='kfold', y=None, groups=None, n_repeats=1, shuffle=False,
+                     random_state=None):
+    """ Assigns each sample to its test fold for all repeats at once.
+
+    Parameters
+    ----------
+    n_samples: int
+    n_splits: int
+    cv_type: str
+        one of `CV_TYPES`
+    y: array-like
+        target values for stratified splits
+    groups: array-like
+        group of each sample for grouped splits
+    n_repeats: int
+        number of repeats with different randomization
+    shuffle: bool
+    random_state: int
+
+    Returns
+    -------
+    numpy.array
+        int32 array of (n_repeats, n_samples) shape including the test fold of each sample;
+        -1 indicates samples that are never in a test set (the first block of time series splits).
+
+    Raises
+    ------
+    ValueError
+        if folds cannot be created, e.g., fewer groups than splits or repeated time series splits.
+    """
+    if cv_type == 'time_series' and n_repeats > 1:
+        raise ValueError("Time series splits are not shuffled; therefore, they cannot be repeated (n_repeats: "
+                         f"{n_repeats})")
+    if cv_type in ['kfold', 'stratified', 'repeated_stratified']:
+        return _sklearn_folds(n_samples, n_splits, cv_type, y, n_repeats, shuffle, random_state)
+    rng = np.random.default_rng(random_state)
+    # Repeats are only meaningful when samples are shuffled differently each time
+    shuffle = shuffle or n_repeats > 1
+    assignments = np.empty((n_repeats, n_samples), dtype=np.int32)
+    for r in range(n_repeats):
+        if cv_type == 'group':
+            assignments[r] = _grouped(pd.factorize(np.asarray(groups))[0], n_splits, shuffle, rng)
+        elif cv_type == 'stratified_group':
+            assignments[r] = _stratified_grouped(y, groups, n_splits, shuffle, rng)
+        elif cv_type == 'time_series':
+            assignments[r] = _time_series(n_samples, n_splits)
+        else:
+            raise ValueError(f"{cv_type} is not supported; supported types: {CV_TYPES}")
+    return assignments
+
+
+def fold_indices(assignment, fold, cv_type='kfold'):
+    """ Builds positional indices of train and test samples of a fold from the fold assignment of samples.
+
+    Parameters
+    ----------
+    assignment: numpy.array
+        test fold of each sample in a single repeat
+    fold: int
+    cv_type: str
+
+    Returns
+    -------
+    train_indices: numpy.array
+    test_indices: numpy.array
+    """
+    if cv_type == 'time_series':
+        # Only preceding samples are used for training
+        return np.flatnonzero(assignment < fold), np.flatnonzero(assignment == fold)
+    return np.flatnonzero(assignment != fold), np.flatnonzero(assignment == fold)
+
+
+def save_fold_assignments(filename, assignments, n_splits, cv_type):
+    """ Saves fold assignments into a compact `.npz` file without pickled objects.
+    """
+    np.savez(filename, folds=assignments, n_splits=np.int32(n_splits), cv_type=np.array(cv_type))
+
+
+def _sklearn_folds(n_samples, n_splits, cv_type, y, n_repeats, shuffle, random_state):
+    # scikit-learn splitters keep folds of a `random_state` the same as in previous versions of the app
+    from sklearn.model_selection import KFold, StratifiedKFold, RepeatedKFold, RepeatedStratifiedKFold
+    stratified = cv_type != 'kfold'
+    if n_repeats > 1 or cv_type == 'repeated_stratified':
+        # Repeated splitters always shuffle
+        splitter = RepeatedStratifiedKFold if stratified else RepeatedKFold
+        cv = splitter(n_splits=n_splits, n_repeats=n_repeats, random_state=random_state)
+    else:
+        splitter = StratifiedKFold if stratified else KFold
+        cv = splitter(n_splits=n_splits, shuffle=shuffle, random_state=random_state if shuffle else None)
+    assignments = np.empty((n_repeats, n_samples), dtype=np.int32)
+    for i, (_, test_indices) in enumerate(cv.split(np.zeros(n_samples), y if stratified else None)):
+        assignments[i // n_splits, test_indices] = i % n_splits
+    return assignments
+
+
+def _grouped(codes, n_splits, shuffle, rng):
+    # Groups are assigned, from the largest to the smallest one, to the fold with the least samples so far
+    sizes = np.bincount(codes)
+    if len(sizes) < n_splits:
+        raise ValueError(f"Cannot have number of splits n_splits={n_splits} greater than the number of groups: "
+                         f"{len(sizes)}")
+    tie_breaker = rng.random(len(sizes)) if shuffle else np.arange(len(sizes))
+    group_fold = np.empty(len(sizes), dtype=np.int32)
+    fold_sizes = np.zeros(n_splits, dtype=np.int64)
+    for group in np.lexsort((tie_breaker, -sizes)):
+        fold = np.argmin(fold_sizes)
+        group_fold[group] = fold
+        fold_sizes[fold] += sizes[group]
+    return group_fold[codes]
+
+
+def _stratified_grouped(y, groups, n_splits, shuffle, rng):
+    from sklearn.model_selection import StratifiedGroupKFold
+    random_state = int(rng.integers(2 ** 31 - 1)) if shuffle else None
+    cv = StratifiedGroupKFold(n_splits=n_splits, shuffle=shuffle, random_state=random_state)
+    assignment = np.empty(len(y), dtype=np.int32)
+    for fold, (_, test_indices) in enumerate(cv.split(np.zeros(len(y)), y, groups)):
+        assignment[test_indices] = fold
+    return assignment
+
+
+def _time_series(n_samples, n_splits):
+    if n_samples <= n_splits:
+        raise ValueError(f"Time series splits need more samples than splits; "
+                         f"number of samples: {n_samples}, number of splits: {n_splits}")
+    test_size = n_samples // (n_splits + 1)
+    first_test = n_samples - n_splits * test_size
+    assignment = np.full(n_samples, -1, dtype=np.int32)
+    assignment[first_test:] = np.arange(n_samples - first_test) // test_size
+    return assignment
@@ -12,9 +12,16 @@
     limitations under the License.
 """
 import bios
+import filecmp
 import os
 import shutil
-from FeatureCloud.app.engine.app import AppState, LogLevel
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from FeatureCloud.app.engine.app import AppState, LogLevel, SMPCOperation
+from FeatureCloud.app.engine.app import State as op_state
+from CustomStates.SplitPlan import SplitPlan
+from CustomStates.Manifest import Manifest
+from CustomStates.Profiler import profiler, instrument
+from utils import in_memory, set_debug, JsonSerializer, encode_fixed_point, fixed_point_fits, choose_precision
 
 
 class State(AppState):
@@ -42,14 +49,30 @@ class State(AppState):
         `file`: there is only a single file for each data.
     dir: str
         the directory name for input/output data.
+    n_jobs: int
+        number of processes for processing splits in parallel.
+        Default: 1
+    resume: bool
+        whether to skip work that was completed in previous runs with the same inputs and config.
+        Default: False
+    fingerprint: str
+        `stat` or `content`; how input files are fingerprinted for resuming.
+        Default: `stat`
 
     Methods
     -------
     lazy_init()
     read_config()
     finalize_config()
+    map_splits(func, *iterables, n_jobs=None, progress=None, cache=None, sections=())
+    smpc_payload(data)
+    agree_on_precision(vector)
     """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        instrument(cls)
+
     def __init__(self, app_name, input_dir: str = "/mnt/input", output_dir: str = "/mnt/output"):
         self.config = {}
         self.input_dir = input_dir
@@ -57,6 +80,9 @@ class State(AppState):
         self.config_file = f"{self.input_dir}/config.yml"
         self.mode = 'file'
         self.dir = '.'
+        self.n_jobs = 1
+        self.resume = False
+        self.fingerprint = 'stat'
         self.app_name = app_name
 
     def lazy_init(self):
@@ -65,13 +91,21 @@ class State(AppState):
             Keys:
             
             `use_smpc`: User-preference on using SMPC.
-            `splits`: names of splits(it should be the same for all data).
+            `splits`: sorted names of splits(it should be the same for all data).
             `input_files`: paths to all input files regarding the data splits.
             `output_files`: paths to all output files regarding the data splits.
+            `split_plan`: `SplitPlan` instance to look up paths of a split.
+            `manifest`: `Manifest` of completed work to resume from.
+            `structure`: structure of the flattened SMPC payload.
+            `precision`: precision of fixed-point SMPC payloads, or None.
             
         """
         self.store('smpc_used', False)
-        self.store('splits', set())
+        self.store('splits', [])
+        self.store('split_plan', None)
+        self.store('manifest', None)
+        self.store('structure', None)
+        self.store('precision', None)
         self.store('input_files', {})
         self.store('output_files', {})
 
@@ -81,16 +115,19 @@ class State(AppState):
             if it does not exist, default values will be used.
         """
         self.config = bios.read(self.config_file)[self.app_name]
-        if 'debug' in self.config:
-            if self.config['debug']:
-                self.store('debug', True)
-                self.log("Debug mode is ON", LogLevel.DEBUG)
-            else:
-                self.store('debug', False)
+        self.store('debug', bool(self.config.get('debug', False)))
+        set_debug(self.load('debug'))
+        profiler.enabled = bool(self.config.get('profile', False))
+        profiler.output_dir = self.output_dir
+        if self.load('debug'):
+            self.log("Debug mode is ON", LogLevel.DEBUG)
 
         if 'logic' in self.config:
             self.mode = self.config['logic']['mode']
             self.dir = self.config['logic']['dir']
+            self.n_jobs = self.config['logic'].get('n_jobs', 1) or 1
+            self.resume = self.config['logic'].get('resume', False)
+            self.fingerprint = self.config['logic'].get('fingerprint', 'stat')
         else:
             self.log(f"There are no 'logic' options in 'config.yml' file!\n"
                      f"default values will be used:\n"
@@ -101,20 +138,152 @@ class State(AppState):
         """  Generates split names, paths to input and output files.
              Regarding the `mode` of the app, there should be some splits for data,
              and for each data, different splits should be processed.
+             The split plan is persisted in the output directory and reused in reruns
+             as long as the config and the directory of splits have not changed.
         """
-        if self.mode == "directory":
-            splits = [f.path for f in os.scandir(f'{self.input_dir}/{self.dir}') if f.is_dir()]
-        else:
-            splits = [self.input_dir, ]
-        self.store('splits', set(sorted(splits)))
+        plan_file = f"{self.output_dir}/.split_plan.json"
+        options = dict(input_dir=self.input_dir, output_dir=self.output_dir, mode=self.mode, dir=self.dir,
+                       local_dataset=self.config['local_dataset'], result=self.config['result'])
+        plan = SplitPlan.load(plan_file)
+        if plan is None or not plan.matches(**options):
+            plan = SplitPlan.build(**options)
+            for split in plan.splits:
+                os.makedirs(plan.output_split(split), exist_ok=True)
+            plan.save(plan_file)
+        self.store('split_plan', plan)
+        self.store('manifest', Manifest(f"{self.output_dir}/.manifest.json", self.fingerprint, self.resume))
+        self.store('splits', plan.splits)
         self.log(f" Splits order:")
-        for i, split in enumerate(self.load('splits')):
+        for i, split in enumerate(plan.splits):
             self.log(f"Split {i}: {split}")
-        self.store('input_files', {k: [f"{split}/{v}" for split in self.load('splits')]
-                                   for k, v in self.config['local_dataset'].items()})
-        self.store('output_files', {k: [f"{split.replace('/input', '/output')}/{v}"
-                                        for split in self.load('splits')]
-                                    for k, v in self.config['result'].items()})
-        for split in self.load('splits'):
-            os.makedirs(split.replace("/input", "/output"), exist_ok=True)
-        shutil.copyfile(self.input_dir + '/config.yml', self.output_dir + '/config.yml')
+        self.store('input_files', plan.input_files)
+        self.store('output_files', plan.output_files)
+        output_config = self.output_dir + '/config.yml'
+        if not os.path.isfile(output_config) or not filecmp.cmp(self.config_file, output_config, shallow=False):
+            shutil.copyfile(self.config_file, output_config)
+
+    def map_splits(self, func, *iterables, n_jobs=None, progress=None, cache=None, sections=()):
+        """ Applies `func` on the arguments of each split, in parallel with a pool of processes
+            when more than one job is requested. Results are returned in the same order as the
+            arguments, i.e., the order of splits, regardless of which split finishes first.
+            With `cache`, results are recorded in the manifest and, when resuming, splits whose
+            input files (string arguments) and `sections` have not changed are not recomputed.
+
+        Parameters
+        ----------
+        func: callable
+            should be picklable, i.e., defined at the module level, to be used with more than one job.
+        iterables: list
+            arguments of `func`, one item per split, e.g., `self.load('input_files')['data']`
+        n_jobs: int
+            number of processes; if None, the `n_jobs` value in `logic` will be used.
+        progress: tuple
+            (start, end) range of the overall progress that will be reported as splits are done.
+        cache: str
+            name of the step for recording results in the manifest; results should be JSON-serializable.
+        sections: tuple
+            config options that affect the results
+
+        Returns
+        -------
+        list
+            result of `func` for each split
+        """
+        args = list(zip(*iterables))
+        results = [None] * len(args)
+        pending = list(range(len(args)))
+        if cache is not None:
+            manifest = self.load('manifest')
+            keys = [f"{cache}:{split}" for split in self.load('splits')]
+            fingerprints = [manifest.fingerprint([a for a in arg if isinstance(a, str)], *sections) for arg in args]
+            for i in range(len(args)):
+                entry = manifest.lookup(keys[i], fingerprints[i])
+                if entry is not None:
+                    results[i] = entry['result']
+            pending = [i for i in pending if results[i] is None]
+            if len(pending) < len(args):
+                self.log(f"{len(args) - len(pending)} out of {len(args)} splits are reused for {cache}")
+        n_jobs = min(int(n_jobs or self.n_jobs), len(pending))
+        if in_memory():
+            # Outputs that are kept in memory should be produced in this process
+            n_jobs = 1
+        if n_jobs <= 1:
+            for done, i in enumerate(pending):
+                results[i] = func(*args[i])
+                if cache is not None:
+                    manifest.record(keys[i], fingerprints[i], result=results[i])
+                self._report_split_progress(done + 1, len(pending), progress)
+            return results
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {executor.submit(func, *args[i]): i for i in pending}
+            for done, future in enumerate(as_completed(futures)):
+                i = futures[future]
+                results[i] = future.result()
+                if cache is not None:
+                    manifest.record(keys[i], fingerprints[i], result=results[i])
+                self._report_split_progress(done + 1, len(pending), progress)
+        return results
+
+    def _report_split_progress(self, done, total, progress):
+        if progress is not None:
+            start, end = progress
+            self.update(progress=start + (end - start) * done / total)
+
+    def smpc_payload(self, data):
+        """ Flattens local data into a single vector for SMPC aggregation and stores its structure
+            and precision, which the coordinator needs to decode the aggregated data with `utils.decode_smpc`.
+            If `fixed_point` is enabled in the config, values are encoded as int64 fixed-point values
+            with `precision` decimal digits, and the controller does not scale them any further.
+            With `precision: auto`, the default, clients agree on the precision first; see `agree_on_precision`.
+
+        Parameters
+        ----------
+        data: object
+            local data, e.g., nested lists of statistics
+
+        Returns
+        -------
+        list
+        """
+        fixed_point = self.config.get('fixed_point', None) or {}
+        precision = fixed_point.get('precision', 'auto') if fixed_point.get('enabled', False) else None
+        vector, structure = JsonSerializer().flatten(data)
+        # The SMPC configuration is shared by all states, e.g., of apps in a workflow; float values are scaled as usual
+        self.configure_smpc(exponent=8 if precision is None else 0)
+        try:
+            if precision is not None:
+                if precision == 'auto':
+                    precision = self.agree_on_precision(vector)
+                vector = encode_fixed_point(vector, precision, len(self.clients))
+        except (OverflowError, ValueError) as e:
+            self.log(f"Local data cannot be encoded for SMPC:\n{e}", LogLevel.ERROR)
+            self.update(state=op_state.ERROR)
+            raise
+        self.store('structure', structure)
+        self.store('precision', precision)
+        return vector.tolist()
+
+    def agree_on_precision(self, vector):
+        """ Agrees with other clients on the largest precision at which the values of all clients can be added
+            without overflowing int64. Each client sends, through SMPC, which precisions fit its own values,
+            and the coordinator broadcasts the largest precision that fits for all clients.
+            Therefore, only the number of clients that each precision fits is revealed.
+
+        Parameters
+        ----------
+        vector: numpy.array
+
+        Returns
+        -------
+        int
+        """
+        self.send_data_to_coordinator(data=fixed_point_fits(vector, len(self.clients)), use_smpc=True)
+        if self.is_coordinator:
+            fits = self.aggregate_data(operation=SMPCOperation.ADD, use_smpc=True)
+            self.broadcast_data(data=choose_precision(fits, len(self.clients)))
+        precision = self.await_data(n=1, unwrap=True, is_json=False)
+        if precision is None:
+            raise OverflowError(f"Values of some clients are too large to be added over {len(self.clients)} clients "
+                                f"in int64 with any precision")
+        self.log(f"Fixed-point precision: {precision}", LogLevel.DEBUG)
+        return precision
@@ -0,0 +1,127 @@
+"""
+    FeatureCloud Custom States
+    Copyright 2021 Mohammad Bakhtiari. All Rights Reserved.
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+        http://www.apache.org/licenses/LICENSE-2.0
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import hashlib
+import json
+import os
+
+
+class Manifest:
+    """
+    Record of completed work, e.g., outputs or local statistics of a split, alongside the fingerprint
+    of inputs and config options they were computed from. In reruns, work can be skipped
+    if the fingerprint has not changed and all recorded outputs still exist.
+
+    Attributes
+    ----------
+    filename: str
+        path to the JSON file of the manifest
+    method: str
+        `stat`: fingerprints are based on size and modification time of input files.
+        `content`: fingerprints are based on the content of input files.
+    enabled: bool
+        if False, input files are not fingerprinted, nothing is looked up or recorded, i.e., everything is recomputed.
+    entries: dict
+
+    Methods
+    -------
+    fingerprint(files, *sections)
+    lookup(key, fingerprint)
+    record(key, fingerprint, outputs=(), result=None)
+    """
+
+    def __init__(self, filename, method='stat', enabled=True):
+        self.filename = filename
+        self.method = method
+        self.enabled = enabled
+        self.entries = {}
+        if os.path.isfile(filename):
+            try:
+                with open(filename) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    def fingerprint(self, files, *sections):
+        """ Fingerprints input files and relevant config options
+
+        Parameters
+        ----------
+        files: list
+            paths to input files; missing files are fingerprinted as missing.
+        sections: dict
+            config options, or any JSON-serializable value, that affect the outputs
+
+        Returns
+        -------
+        str or None
+            None, if the manifest is disabled.
+        """
+        if not self.enabled:
+            return None
+        h = hashlib.sha1(json.dumps(sections, sort_keys=True, default=str).encode())
+        for file in files:
+            h.update(file.encode())
+            if not os.path.isfile(file):
+                h.update(b'missing')
+            elif self.method == 'content':
+                with open(file, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        h.update(block)
+            else:
+                st = os.stat(file)
+                h.update(f"{st.st_size}:{st.st_mtime_ns}".encode())
+        return h.hexdigest()
+
+    def lookup(self, key, fingerprint):
+        """ Finds completed work with the same fingerprint
+
+        Parameters
+        ----------
+        key: str
+            e.g., name of the step and the split
+        fingerprint: str
+
+        Returns
+        -------
+        dict or None
+            the recorded entry with `fingerprint`, `outputs`, and `result` keys;
+            None, if the work should be (re)done.
+        """
+        entry = self.entries.get(key, None)
+        if not self.enabled or entry is None or entry['fingerprint'] != fingerprint:
+            return None
+        if not all(os.path.isfile(output) for output in entry['outputs']):
+            return None
+        return entry
+
+    def record(self, key, fingerprint, outputs=(), result=None):
+        """ Records completed work and persists the manifest; the file is replaced atomically,
+            so that a failure in the middle of writing does not corrupt previous entries.
+
+        Parameters
+        ----------
+        key: str
+        fingerprint: str
+        outputs: list
+            paths to output files that should exist to reuse the work
+        result: object
+            JSON-serializable result of the work, e.g., local statistics
+        """
+        if not self.enabled:
+            return
+        self.entries[key] = {'fingerprint': fingerprint, 'outputs': list(outputs), 'result': result}
+        tmp = f"{self.filename}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.filename)
@@ -0,0 +1,248 @@
+"""
+    FeatureCloud Custom States
+    Copyright 2021 Mohammad Bakhtiari. All Rights Reserved.
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+        http://www.apache.org/licenses/LICENSE-2.0
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import contextlib
+import csv
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+FIELDS = ['client', 'state', 'start', 'wall_time', 'cpu_time', 'peak_rss', 'bytes_read', 'bytes_written',
+          'bytes_sent', 'bytes_received']
+
+
+class Profiler:
+    """
+    Records wall and CPU time, peak memory, disk I/O, and network traffic of each executed state.
+    CPU time includes child processes, e.g., of `map_splits`; peak memory and I/O are measured for the app process,
+    and I/O includes reads and writes that are served by the page cache.
+    Traffic is measured on the data that the controller delivers to, and collects from, the app
+    and is attributed to the most recently started state of the same client,
+    i.e., data sent at the end of a state is counted for that state.
+    Measurements that are not available on the platform are recorded as None.
+
+    Attributes
+    ----------
+    records: list
+        one dictionary with `FIELDS` keys per executed state
+    enabled: bool or None
+        whether reports are written into `output_dir`; None until the config is read.
+        If False, states are neither measured nor recorded, so that profiling costs nothing.
+    output_dir: str
+
+    Methods
+    -------
+    attach(app)
+    detach(app)
+    measure(state_name, client=None)
+    count(client, key, data)
+    report(output_dir=None)
+    """
+
+    def __init__(self, output_dir="/mnt/output"):
+        self.records = []
+        self.enabled = None
+        self.output_dir = output_dir
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def attach(self, app):
+        """ Wraps `handle_incoming` and `handle_outgoing` of the FeatureCloud app to count transferred bytes;
+            attaching the same app more than once, or while profiling is disabled, has no effect.
+        """
+        if self.enabled is False or getattr(app, '_profiled', False):
+            return
+        handle_incoming, handle_outgoing = app.handle_incoming, app.handle_outgoing
+
+        def incoming(data, client):
+            self.count(app.id, 'bytes_received', data)
+            return handle_incoming(data, client)
+
+        def outgoing():
+            data = handle_outgoing()
+            self.count(app.id, 'bytes_sent', data)
+            return data
+
+        app._unprofiled = handle_incoming, handle_outgoing
+        app.handle_incoming, app.handle_outgoing, app._profiled = incoming, outgoing, True
+
+    def detach(self, app):
+        """ Restores `handle_incoming` and `handle_outgoing` of an attached app
+        """
+        if getattr(app, '_profiled', False):
+            app.handle_incoming, app.handle_outgoing = app._unprofiled
+            app._profiled = False
+
+    def measure(self, state_name, client=None):
+        """ Context manager that records a state from entering to leaving it
+
+        Parameters
+        ----------
+        state_name: str
+        client: str
+            ID of the client that executes the state; there is one per process, except in benchmarks.
+
+        Returns
+        -------
+        _Measurement
+            or a context manager that does nothing, if profiling is disabled.
+        """
+        if self.enabled is False:
+            return contextlib.nullcontext()
+        return _Measurement(self, state_name, client)
+
+    def report(self, output_dir=None):
+        """ Writes records into `profile.json` and `profile.csv` inside the output directory.
+        """
+        output_dir = output_dir or self.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        with self._lock:
+            records = [dict(r) for r in self.records]
+        with open(f"{output_dir}/profile.json", 'w') as f:
+            json.dump(records, f, indent=2)
+        with open(f"{output_dir}/profile.csv", 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+    def count(self, client, key, data):
+        """ Adds the size of transferred data to the current record of the client
+
+        Parameters
+        ----------
+        client: str
+        key: str
+            `bytes_sent` or `bytes_received`
+        data: bytes or str
+        """
+        record = self._current.get(client, None)
+        if data is None or record is None:
+            return
+        with self._lock:
+            record[key] += len(data)
+
+
+class _Measurement:
+    def __init__(self, profiler, state_name, client):
+        self.profiler = profiler
+        self.record = {field: None for field in FIELDS}
+        self.record.update(client=client, state=state_name, start=time.time(), bytes_sent=0, bytes_received=0)
+
+    def __enter__(self):
+        _reset_peak_rss()
+        self.io = _io_counters()
+        self.cpu = _cpu_time()
+        self.wall = time.perf_counter()
+        with self.profiler._lock:
+            self.profiler.records.append(self.record)
+            self.profiler._current[self.record['client']] = self.record
+        return self.record
+
+    def __exit__(self, *exc):
+        if self.profiler.enabled is False:
+            # Profiling was disabled by the config that is read in this state
+            with self.profiler._lock:
+                self.profiler.records.remove(self.record)
+                if self.profiler._current.get(self.record['client'], None) is self.record:
+                    del self.profiler._current[self.record['client']]
+            return False
+        self.record['wall_time'] = time.perf_counter() - self.wall
+        self.record['cpu_time'] = _cpu_time() - self.cpu
+        self.record['peak_rss'] = _peak_rss()
+        io = _io_counters()
+        if io is not None and self.io is not None:
+            self.record['bytes_read'] = io[0] - self.io[0]
+            self.record['bytes_written'] = io[1] - self.io[1]
+        return False
+
+
+def instrument(cls):
+    """ Class decorator that records each run of an `AppState` with the `profiler`
+        and writes the report after each state if profiling is enabled, i.e., `profile: true` in the config.
+        `ConfigState.State` subclasses are instrumented automatically.
+    """
+    run = cls.__dict__.get('run', None)
+    if run is None or getattr(run, '_instrumented', False):
+        return cls
+
+    @functools.wraps(run)
+    def instrumented_run(self, *args, **kwargs):
+        profiler.attach(self._app)
+        try:
+            with profiler.measure(self.name, self.id):
+                return run(self, *args, **kwargs)
+        finally:
+            if profiler.enabled:
+                profiler.report()
+            elif profiler.enabled is False:
+                profiler.detach(self._app)
+
+    instrumented_run._instrumented = True
+    cls.run = instrumented_run
+    return cls
+
+
+def _cpu_time():
+    cpu = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+
+def _reset_peak_rss():
+    """ Resets the peak resident set size of the process (Linux only), so that it can be measured per state
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    """ Peak resident set size in bytes since the last reset or, if it cannot be reset, since the start of the process
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # kilobytes on Linux; bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _io_counters():
+    """ Bytes read and written by the process, including the page cache (Linux only)
+    """
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+profiler = Profiler()
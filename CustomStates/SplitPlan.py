@@ -0,0 +1,156 @@
+"""
+    FeatureCloud Custom States
+    Copyright 2021 Mohammad Bakhtiari. All Rights Reserved.
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+        http://www.apache.org/licenses/LICENSE-2.0
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import json
+import os
+
+
+class SplitPlan:
+    """
+    Ordered split names and precomputed paths to in/output files of each split.
+    Plans are persisted as JSON files and can be reused as long as the config and
+    the directory of splits have not changed.
+
+    Attributes
+    ----------
+    mode: str
+        `directory` or `file`
+    root: str
+        directory that was scanned for splits
+    output_root: str
+        output directory that mirrors the input directory
+    splits: list
+        sorted paths to splits
+    output_splits: list
+        paths to output directories of splits
+    input_files: dict
+        key of `local_dataset` as key and list of input paths, one per split, as value
+    output_files: dict
+        key of `result` as key and list of output paths, one per split, as value
+    stats: dict
+        `mtime_ns` of the root directory and each split, which are used to detect changes
+    signature: str
+        config options that the plan was built from
+    index: dict
+        split as key and its position as value
+
+    Methods
+    -------
+    build(input_dir, output_dir, mode, dir, local_dataset, result)
+    matches(input_dir, output_dir, mode, dir, local_dataset, result)
+    output_split(split)
+    input_file(key, split)
+    output_file(key, split)
+    save(filename)
+    load(filename)
+    """
+    __slots__ = ('mode', 'root', 'output_root', 'splits', 'output_splits', 'input_files', 'output_files', 'stats',
+                 'signature', 'index')
+
+    def __init__(self, mode, root, output_root, splits, output_splits, input_files, output_files, stats, signature):
+        self.mode = mode
+        self.root = root
+        self.output_root = output_root
+        self.splits = list(splits)
+        self.output_splits = list(output_splits)
+        self.input_files = input_files
+        self.output_files = output_files
+        self.stats = stats
+        self.signature = signature
+        self.index = {split: i for i, split in enumerate(self.splits)}
+
+    @classmethod
+    def build(cls, input_dir, output_dir, mode, dir, local_dataset, result):
+        """ Scans the input directory once and builds paths to all in/output files.
+            Outputs of each split are placed at the same relative path inside the output directory.
+
+        Parameters
+        ----------
+        input_dir: str
+        output_dir: str
+        mode: str
+        dir: str
+        local_dataset: dict
+            `local_dataset` part of the config file
+        result: dict
+            `result` part of the config file
+
+        Returns
+        -------
+        SplitPlan
+        """
+        root = f'{input_dir}/{dir}' if mode == "directory" else input_dir
+        if mode == "directory":
+            splits = sorted(f.path for f in os.scandir(root) if f.is_dir())
+        else:
+            splits = [input_dir, ]
+        output_splits = [f"{output_dir}{split[len(input_dir):]}" for split in splits]
+        input_files = {k: [f"{split}/{v}" for split in splits] for k, v in local_dataset.items()}
+        output_files = {k: [f"{split}/{v}" for split in output_splits] for k, v in result.items()}
+        return cls(mode, root, output_dir, splits, output_splits, input_files, output_files, cls._stat(root, splits),
+                   cls._signature(mode, dir, local_dataset, result))
+
+    def matches(self, input_dir, output_dir, mode, dir, local_dataset, result):
+        """ Checks whether the plan is still valid for the config and the directory of splits.
+            Adding or removing splits changes `mtime_ns` of the root directory; therefore,
+            the directory is only scanned if it has changed.
+
+        Returns
+        -------
+        bool
+        """
+        root = f'{input_dir}/{dir}' if mode == "directory" else input_dir
+        if self.root != root or self.output_root != output_dir:
+            return False
+        if self.signature != self._signature(mode, dir, local_dataset, result):
+            return False
+        try:
+            return self.stats == self._stat(root, self.splits)
+        except OSError:
+            return False
+
+    def output_split(self, split):
+        return self.output_splits[self.index[split]]
+
+    def input_file(self, key, split):
+        return self.input_files[key][self.index[split]]
+
+    def output_file(self, key, split):
+        return self.output_files[key][self.index[split]]
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({k: getattr(self, k) for k in self.__slots__ if k != 'index'}, f)
+
+    @classmethod
+    def load(cls, filename):
+        """ Loads a persisted plan
+
+        Returns
+        -------
+        SplitPlan or None
+            None, if there is no valid plan file.
+        """
+        try:
+            with open(filename) as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _stat(root, splits):
+        return {path: os.stat(path).st_mtime_ns for path in [root, *splits]}
+
+    @staticmethod
+    def _signature(mode, dir, local_dataset, result):
+        return json.dumps([mode, dir, local_dataset, result], sort_keys=True, default=str)
@@ -12,14 +12,20 @@
     limitations under the License.
 """
 
+from time import sleep
+from FeatureCloud.app.engine import app as engine
 from FeatureCloud.app.engine.app import app_state, AppState, Role, LogLevel
 from FeatureCloud.app.engine.app import State as op_state
 import pandas as pd
+import numpy as np
 import bios
-from utils import save_numpy, load_numpy, sep_feat_from_label, log_send_data, log_data
+from utils import save_numpy, load_numpy, sep_feat_from_label, log_send_data, log_data, read_csv, write_csv, \
+    debug_enabled
 from CustomStates import ConfigState
+from CustomStates.Profiler import instrument
 
-from .utils import log_dataframe, plot_clients_data, noniid_sampling, unsupervised_iid_sampling, supervised_iid_sampling
+from .utils import log_dataframe, plot_clients_data, noniid_sampling, unsupervised_iid_sampling, \
+    supervised_iid_sampling, dirichlet_sampling, partition_indices, split_chunks, encode_partition, decode_partition
 
 name = 'data_distributor'
 
@@ -40,25 +46,57 @@ class DistributeData(ConfigState.State):
             df = self.load_dataset(file_name)
             clients_data = self.sample_dataset(df)
 
-            plot_clients_data(clients_data, self.output_dir)
+            if self.config.get('plot', True):
+                plot_clients_data(clients_data, self.output_dir)
             config_file = bios.read(self.config_file)
-            for client in self.clients:
-                client_data = clients_data[clients_data.ASSIGNED_CLIENT == client]
-                log_send_data([client_data, config_file], self.log)
-                self.send_data_to_participant(data=[client_data, config_file], destination=client)
+            self.send_partitions(clients_data, config_file)
             self.store('config', self.config)
         else:
-            self.store('splits', {'temp'})
+            self.store('splits', ['temp'])
+            self.store('output_dir', self.output_dir)
 
         return 'WriteResults'
 
+    def send_partitions(self, clients_data, config_file):
+        """ Sends each client its own partition, chunk by chunk, after a header message including
+            number of chunks, payload type, and the config file.
+            All partitions are indexed in a single group-by pass over the assigned clients.
+
+        Parameters
+        ----------
+        clients_data: pandas.DataFrame
+        config_file: dict
+
+        """
+        transfer = self.config.get('transfer', None) or {}
+        binary, chunk_size = transfer.get('binary', False), transfer.get('chunk_size', None)
+        partitions = partition_indices(clients_data.ASSIGNED_CLIENT.to_numpy(), self.clients)
+        for client in self.clients:
+            chunks = split_chunks(partitions[client], chunk_size)
+            self.send_data_to_participant(data=[len(chunks), binary, config_file], destination=client)
+            for indices in chunks:
+                client_data = clients_data.iloc[indices]
+                log_send_data([client_data, config_file], self.log)
+                if binary:
+                    client_data = encode_partition(client_data)
+                self.send_data_to_participant(data=client_data, destination=client)
+                del client_data
+                self.wait_until_sent()
+
+    def wait_until_sent(self):
+        """ Waits until the controller has collected all queued messages, so that the next chunk
+            is only serialized once the previous one is gone.
+        """
+        while self._app.data_outgoing:
+            sleep(engine.DATA_POLL_INTERVAL)
+
     def sanity_check(self):
         self.config['format'] = self.config['local_dataset']['data'].strip().split(".")[-1].lower()
         if not self.config['format'] in ['txt', 'npy', 'npz', 'csv']:
             self.log(f"Unsupported {self.config['format']} file extension!", LogLevel.ERROR)
             self.update(state=op_state.ERROR)
         self.config['sampling']['type'] = self.config['sampling']['type'].lower()
-        if not self.config['sampling']['type'] in ['non-iid', 'noniid', 'non_iid', 'iid']:
+        if not self.config['sampling']['type'] in ['non-iid', 'noniid', 'non_iid', 'iid', 'dirichlet']:
             self.log(f"Unsupported {self.config['sampling']['type']} type!", LogLevel.ERROR)
             self.update(state=op_state.ERROR)
 
@@ -76,11 +114,12 @@ class DistributeData(ConfigState.State):
 
         """
         if self.config['format'] in ['txt', 'csv']:
-            df = pd.read_csv(file_name, sep=self.config['local_dataset']['sep'])
+            df = read_csv(file_name, sep=self.config['local_dataset']['sep'],
+                          **(self.config['local_dataset'].get('reader', None) or {}))
             if self.config['local_dataset']['task'] == "classification":
                 df = df.rename(columns={self.config['local_dataset']['target_value']: 'label'})
-                self.log(df.columns, LogLevel.DEBUG)
-                self.log(log_dataframe(df), LogLevel.DEBUG)
+                if debug_enabled():
+                    self.log(log_dataframe(df), LogLevel.DEBUG)
             return df
         if self.config['format'] in ['npy', 'npz']:
             ds = load_numpy(file_name)
@@ -99,32 +138,50 @@ class DistributeData(ConfigState.State):
             return pd.DataFrame({"features": [s for s in ds]})
 
     def sample_dataset(self, df):
-        non_iid_ness = self.config['sampling']['non_iid_ness']
+        non_iid_ness = self.config['sampling'].get('non_iid_ness', None)
+        rng = np.random.default_rng(self.config['sampling'].get('seed', None))
+        n_unlabeled = int(df.label.isna().sum())
+        if n_unlabeled > 0:
+            self.log(f"{n_unlabeled} samples without a label are not distributed", LogLevel.DEBUG)
         if self.config['sampling']['type'] in ['non-iid', 'noniid', 'non_iid']:
-            labels = df.label.unique()
+            labels = df.label.dropna().unique()
             if int(non_iid_ness) <= 0 or int(non_iid_ness) > len(labels):
                 self.log(f"Level of Non-IID-ness is restricted to the number of classes!\n"
                          f"Number of labels: {len(labels)}"
                          f"\nNon-IID-ness: {non_iid_ness}", LogLevel.FATAL)
                 self.update(state=op_state.ACTION)
-        df['ASSIGNED_CLIENT'] = None
+        elif self.config['sampling']['type'] == 'dirichlet':
+            alpha = self.config['sampling'].get('alpha', None)
+            if alpha is None or float(alpha) <= 0:
+                self.log(f"Dirichlet sampling requires a positive concentration parameter `alpha`!\n"
+                         f"alpha: {alpha}", LogLevel.FATAL)
+                self.update(state=op_state.ACTION)
         if self.config['local_dataset']['task'] == 'classification':
             if self.config['sampling']['type'] == 'iid':
-                clients_data = supervised_iid_sampling(df, self.clients)
+                clients_data = supervised_iid_sampling(df, self.clients, rng)
+            elif self.config['sampling']['type'] == 'dirichlet':
+                clients_data = dirichlet_sampling(df, self.clients, self.config['sampling']['alpha'],
+                                                  self.config['sampling'].get('quantity_skew', 0), rng)
             else:
-                clients_data = noniid_sampling(df, self.clients, non_iid_ness)
+                clients_data = noniid_sampling(df, self.clients, non_iid_ness, rng)
         else:
             clients_data = unsupervised_iid_sampling()
         return clients_data
 
 
 @app_state(name='WriteResults', role=Role.BOTH)
+@instrument
 class WriteResults(AppState):
     def register(self):
         self.register_transition('terminal', Role.BOTH)
 
     def run(self) -> str:
-        data, config_file = self.await_data(n=1, unwrap=True, is_json=False)
+        n_chunks, binary, config_file = self.await_data(n=1, unwrap=True, is_json=False)
+        chunks = []
+        for _ in range(n_chunks):
+            chunk = self.await_data(n=1, unwrap=True, is_json=False)
+            chunks.append(decode_partition(chunk) if binary else chunk)
+        data = pd.concat(chunks, ignore_index=True)
         if self.is_coordinator:
             file_name = self.load('output_files')['data'][0]
             target = self.load('config')['local_dataset']['target_value']
@@ -132,9 +189,9 @@ class WriteResults(AppState):
         else:
             log_data(data, self.log)
             log_data(config_file, self.log)
-            output_path = "/mnt/output/"
-            file_name = output_path + config_file[name]['result']['data']
-            config_filename = output_path + 'config.yml'
+            output_path = self.load('output_dir')
+            file_name = f"{output_path}/{config_file[name]['result']['data']}"
+            config_filename = f"{output_path}/config.yml"
             target = config_file[name]['local_dataset']['target_value']
             sep = config_file[name]['local_dataset']['sep']
             bios.write(config_filename, config_file)
@@ -143,5 +200,5 @@ class WriteResults(AppState):
             save_numpy(file_name, data.features.values, data.label.values, target)
         else:
             data.rename(columns={'label': target}, inplace=True)
-            data.to_csv(file_name, sep=sep, index=False)
+            write_csv(data, file_name, sep)
         return 'terminal'
@@ -12,13 +12,12 @@
     limitations under the License.
 """
 
+import io
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
 
 
-def supervised_iid_sampling(df, clients):
+def supervised_iid_sampling(df, clients, rng=None):
     """
         IID sampling of data regardless of number of class labels
         Curtrently it supports classification data
@@ -31,38 +30,23 @@ def supervised_iid_sampling(df, clients):
         a dataframe including features and labels of the samples in the dataset
     clients: list
         ID of clients that data should be distributed among them
+    rng: numpy.random.Generator
+        random generator to shuffle samples; a seeded one makes the partitions reproducible.
 
     Returns
     -------
     clients_data: pandas.DataFrame
         a dataframe including ASSIGNED_CLIENT column to indicate the corresponding client
-            that the sample should be assigned.
+            that the sample should be assigned; samples without a label are not assigned.
     """
-    labels = df.label.unique()
-    clients_data = pd.DataFrame({})
-    for label in labels:
-        target_label = df[df.label == label]
-        proportion = len(target_label) // len(clients)
-        for idx, client in enumerate(clients):
-            if idx == len(clients) - 1:
-                drop_indices = target_label.index.values.tolist()
-            else:
-                drop_indices = np.random.choice(target_label.index.values.tolist(), proportion, replace=False)
-            data = target_label.loc[drop_indices]
-            data['ASSIGNED_CLIENT'] = client
-            clients_data = clients_data.append(data, ignore_index=True)
-            target_label = target_label.drop(drop_indices)
-    return clients_data
-
-
-def flatten(df_lists):
-    temp = []
-    for df_list in df_lists:
-        temp += df_list
-    return temp
-
-
-def noniid_sampling(df, clients, noniid):
+    codes, valid = label_codes(df.label)
+    ranks, sizes = shuffled_ranks(codes, rng)
+    client_idx = chunk_index(ranks, sizes[codes], len(clients))
+    df['ASSIGNED_CLIENT'] = assign_clients(clients, client_idx, valid)
+    return df
+
+
+def noniid_sampling(df, clients, noniid, rng=None):
     """ NonIID sampling of data to simulate different levels of data heterogeneity
         across clients. An arbitrary number of clients and class labels are supported.
         in case of having less clients than allowed threshold to distribute samples
@@ -77,44 +61,252 @@ def noniid_sampling(df, clients, noniid):
     noniid: int
         number of clients that have access to samples of a specific class labels.
         In other words, it indicates samples of each class can be found in how many clients.
+    rng: numpy.random.Generator
+        random generator to shuffle samples; a seeded one makes the partitions reproducible.
+
+    Returns
+    -------
+    clients_data: pandas.DataFrame
+        a dataframe including ASSIGNED_CLIENT column to indicate the corresponding client
+            that the sample should be assigned; samples without a label are not assigned.
+    """
+    noniid = int(noniid)
+    codes, valid = label_codes(df.label)
+    ranks, sizes = shuffled_ranks(codes, rng)
+    n_labels = len(sizes)
+    # Samples of each label are split into `noniid` shards, shards are ordered by (shard, label)
+    shards = chunk_index(ranks, sizes[codes], noniid) * n_labels + codes
+
+    # Consecutive shards are assigned to clients; the first `extras` clients get one more shard.
+    n_shards = n_labels * noniid
+    n_labels_for_assign, extras = divmod(n_shards, len(clients))
+    shards_per_client = np.full(len(clients), n_labels_for_assign)
+    shards_per_client[:extras] += 1
+    shard_owner = np.repeat(np.arange(len(clients)), shards_per_client)
+    df['ASSIGNED_CLIENT'] = assign_clients(clients, shard_owner[shards], valid)
+    return df
+
+
+def dirichlet_sampling(df, clients, alpha, quantity_skew=0, rng=None):
+    """ NonIID sampling of data based on Dirichlet distribution, which scales to large number of clients.
+        For each class label, proportions of samples for clients are drawn from Dir(alpha).
+        Smaller values of alpha lead to higher label heterogeneity across clients.
+        Optionally, clients' dataset sizes can also be skewed by log-normal weights.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        a dataframe including features and labels of the samples in the dataset
+    clients: list
+        ID of clients that data should be distributed among them
+    alpha: float
+        concentration parameter of the Dirichlet distribution
+    quantity_skew: float
+        standard deviation(sigma) of the log-normal distribution for clients' weights;
+        zero means no quantity skew.
+    rng: numpy.random.Generator
+        random generator to draw proportions and shuffle samples.
 
     Returns
     -------
     clients_data: pandas.DataFrame
         a dataframe including ASSIGNED_CLIENT column to indicate the corresponding client
-            that the sample should be assigned.
+            that the sample should be assigned; samples without a label are not assigned.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    n_clients = len(clients)
+    codes, valid = label_codes(df.label)
+    ranks, sizes = shuffled_ranks(codes, rng)
+    proportions = rng.dirichlet(np.full(n_clients, float(alpha)), size=len(sizes))
+    if quantity_skew:
+        proportions *= rng.lognormal(mean=0, sigma=float(quantity_skew), size=n_clients)
+        proportions /= proportions.sum(axis=1, keepdims=True)
+    counts = rng.multinomial(sizes, proportions)
+
+    # Upper bound of each (label, client) block in the label-sorted order of samples
+    starts = np.cumsum(sizes) - sizes
+    bounds = (np.cumsum(counts, axis=1) + starts[:, None]).ravel()
+    blocks = np.searchsorted(bounds, starts[codes] + ranks, side='right')
+    df['ASSIGNED_CLIENT'] = assign_clients(clients, blocks % n_clients, valid)
+    return df
+
+
+def label_codes(labels):
+    """ Integer codes of labels, ordered by first appearance, for samples that have a label.
+
+    Parameters
+    ----------
+    labels: pandas.Series
+
+    Returns
+    -------
+    codes: numpy.array
+        label code of each sample that has a label
+    valid: numpy.array
+        boolean mask of samples that have a label
+    """
+    codes, _ = pd.factorize(labels)
+    valid = codes >= 0
+    return codes[valid], valid
+
+
+def assign_clients(clients, client_idx, valid):
+    """ Client of each sample, or None for samples without a label.
+
+    Parameters
+    ----------
+    clients: list
+    client_idx: numpy.array
+        index of the assigned client for each sample that has a label
+    valid: numpy.array
+        boolean mask of samples that have a label
+
+    Returns
+    -------
+    numpy.array
+    """
+    assigned = np.full(len(valid), None, dtype=object)
+    assigned[valid] = np.asarray(clients, dtype=object)[client_idx]
+    return assigned
+
+
+def shuffled_ranks(codes, rng=None):
+    """ Randomly ranks samples within their label group in a single pass.
+
+    Parameters
+    ----------
+    codes: numpy.array
+        integer code of the label for each sample; missing labels(negative codes) are not supported.
+    rng: numpy.random.Generator
+
+    Returns
+    -------
+    ranks: numpy.array
+        position of each sample inside its shuffled label group
+    sizes: numpy.array
+        number of samples for each label code
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    order = rng.permutation(len(codes))
+    order = order[np.argsort(codes[order], kind='stable')]
+    sizes = np.bincount(codes)
+    starts = np.cumsum(sizes) - sizes
+    ranks = np.empty(len(codes), dtype=np.int64)
+    ranks[order] = np.arange(len(codes)) - starts[codes[order]]
+    return ranks, sizes
+
+
+def chunk_index(ranks, group_sizes, n_chunks):
+    """ Splits each shuffled group into `n_chunks` equal chunks, while the last chunk
+        gets the remaining samples of the group.
+
+    Parameters
+    ----------
+    ranks: numpy.array
+        position of each sample inside its group
+    group_sizes: numpy.array
+        size of the group that each sample belongs to
+    n_chunks: int
+
+    Returns
+    -------
+    numpy.array
+        chunk index of each sample
+    """
+    proportion = group_sizes // n_chunks
+    chunk = ranks // np.maximum(proportion, 1)
+    return np.where(proportion > 0, np.minimum(chunk, n_chunks - 1), n_chunks - 1)
+
+
+def partition_indices(assigned, clients):
+    """ Groups positions of samples by their assigned client in a single pass.
+
+    Parameters
+    ----------
+    assigned: numpy.array
+        assigned client of each sample, i.e., the ASSIGNED_CLIENT column
+    clients: list
+        ID of clients
+
+    Returns
+    -------
+    dict
+        client ID as key and positional indices of its samples as value
+    """
+    codes = pd.Categorical(assigned, categories=clients).codes
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(clients))
+    order = order[len(codes) - counts.sum():]
+    return dict(zip(clients, np.split(order, np.cumsum(counts)[:-1])))
+
+
+def split_chunks(indices, chunk_size=None):
+    """ Splits indices into chunks with at most `chunk_size` items;
+        There is always at least one chunk, even if it is empty.
+
+    Parameters
+    ----------
+    indices: numpy.array
+    chunk_size: int
+
+    Returns
+    -------
+    list
+    """
+    if not chunk_size or len(indices) <= chunk_size:
+        return [indices]
+    return np.array_split(indices, int(np.ceil(len(indices) / chunk_size)))
+
+
+def encode_partition(df):
+    """ Encodes a dataframe into a compact binary payload of dense NumPy arrays, one for each column.
+        Columns of equally shaped arrays (e.g., samples of NumPy datasets) are stacked into a single array.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+
+    Returns
+    -------
+    bytes
+    """
+    arrays = {}
+    for i, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        if values.dtype == object and len(values) > 0:
+            try:
+                values = np.stack(values) if isinstance(values[0], np.ndarray) else np.asarray(values.tolist())
+            except ValueError:
+                pass
+        arrays[f"column_{i}"] = values
+    buffer = io.BytesIO()
+    np.savez(buffer, columns=np.asarray([str(c) for c in df.columns]), **arrays)
+    return buffer.getvalue()
+
+
+def decode_partition(payload, columns=None):
+    """ Decodes a binary payload of `encode_partition` into a dataframe.
+
+    Parameters
+    ----------
+    payload: bytes
+    columns: list
+        original names of the columns; by default, names are restored as strings.
+
+    Returns
+    -------
+    pandas.DataFrame
     """
-    labels = df.label.unique()
-    all_splits = [[] for _ in range(noniid)]
-    for label in labels:
-        target_label = df[df.label == label]
-        proportion = len(target_label) // noniid
-        for i in range(noniid):
-            if i == noniid - 1:
-                drop_indices = target_label.index.values.tolist()
-            else:
-                drop_indices = np.random.choice(target_label.index.values.tolist(), proportion, replace=False)
-            data = target_label.loc[drop_indices]
-            all_splits[i].append(data)
-            target_label = target_label.drop(drop_indices)
-    splits = flatten(all_splits)
-    clients_data = pd.DataFrame([], columns=df.columns)
-    counter = 0
-    n_labels_for_assign = len(labels) * noniid // len(clients)
-    extras = len(labels) * noniid % len(clients)
-    for client in clients:
-        for _ in range(n_labels_for_assign):
-            data = splits[counter]
-            data['ASSIGNED_CLIENT'] = client
-            clients_data = clients_data.append(data, ignore_index=True)
-            counter += 1
-        if extras > 0:
-            data = splits[counter]
-            data['ASSIGNED_CLIENT'] = client
-            clients_data = clients_data.append(data, ignore_index=True)
-            counter += 1
-            extras -= 1
-    return clients_data
+    arrays = np.load(io.BytesIO(payload), allow_pickle=True)
+    if columns is None:
+        columns = arrays['columns'].tolist()
+    data = {}
+    for i, column in enumerate(columns):
+        values = arrays[f"column_{i}"]
+        data[column] = list(values) if values.ndim > 1 else values
+    return pd.DataFrame(data, columns=columns)
 
 
 def plot_clients_data(df, path):
@@ -126,6 +318,10 @@ def plot_clients_data(df, path):
     path: str
 
     """
+    # Plotting libraries are slow to import; they are only loaded once a plot is requested
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    df = df[df.ASSIGNED_CLIENT.notna()]
     ax = sns.countplot(data=df, hue='label', x='ASSIGNED_CLIENT')
     ax.legend(bbox_to_anchor=(0.99, 1.05))
     for v in df.ASSIGNED_CLIENT.unique()[:-1]:
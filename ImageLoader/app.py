@@ -13,12 +13,13 @@
 """
 from FeatureCloud.app.engine.app import app_state, AppState, Role, LogLevel
 from FeatureCloud.app.engine.app import State as op_state
-import pandas as pd
 import numpy as np
 import os
-from PIL import Image
 import glob
 from CustomStates import ConfigState
+from CustomStates.Profiler import instrument
+from utils import save_numpy, in_memory
+from .utils import output_shape, decode_images, label_array, LabelManifest
 
 name = 'image_loader'
 
@@ -33,10 +34,19 @@ class ImgLoader(ConfigState.State):
         self.lazy_init()
         self.read_config()
         self.finalize_config()
-        samples, labels = self.load_images(ds_dir=f"{self.input_dir}/{self.config['local_dataset']['ds_dir']}")
+        filenames, labels = self.load_images(ds_dir=f"{self.input_dir}/{self.config['local_dataset']['ds_dir']}")
         self.store('labels', labels)
         self.update(progress=0.3)
-        self.store('samples', self.image_preprocess(samples))
+        manifest = self.load('manifest')
+        options = {k: v for k, v in self.config.items() if k not in ['workers', 'executor', 'logic']}
+        fingerprint = manifest.fingerprint(filenames, options, labels)
+        outputs = [files[0] for files in self.load('output_files').values()]
+        self.store('cache_entry', ('dataset', fingerprint, outputs))
+        if manifest.lookup('dataset', fingerprint) is not None:
+            self.log("Images are already loaded; nothing will be rewritten")
+            self.store('samples', None)
+            return 'WriteResults'
+        self.store('samples', self.image_preprocess(filenames))
         self.update(progress=0.8)
         return 'WriteResults'
 
@@ -56,19 +66,27 @@ class ImgLoader(ConfigState.State):
             folders = []
             for folder in glob.glob(f'{ds_dir}/*/'):
                 folders.append(folder.strip().split('/')[-2])
+            manifest = LabelManifest()
+            global_labels = os.path.exists(f"{ds_dir}/{target}")
+            if global_labels:
+                manifest.read(f"{ds_dir}/{target}", sep=self.config['local_dataset']['sep'])
             for folder in folders:
                 self.log(f"Loading {folder}...")
-                labels_file = f"{ds_dir}/folder/{target}"
-                if os.path.exists(labels_file):
-                    df = pd.read_csv(labels_file, sep=self.config['local_dataset']['sep'])
-                else:
-                    self.update(state=op_state.ERROR)
-                    self.log(f"No {target} file found in {labels_file}!",
-                                 LogLevel.FATAL)
+                labels_file = f"{ds_dir}/{folder}/{target}"
+                if not global_labels:
+                    if not os.path.exists(labels_file):
+                        self.log(f"No {target} file found in {labels_file}!", LogLevel.ERROR)
+                        self.update(state=op_state.ERROR)
+                        continue
+                    manifest.read(labels_file, sep=self.config['local_dataset']['sep'], prefix=f"{folder}/")
                 for format in image_formats:
                     for filename in glob.glob(f'{ds_dir}/{folder}/*.{format}'):  # assuming gif
-                        samples.append(Image.open(filename))
-                        labels.append(df[df.name == filename.strip().split('/')[-1]].label.values.item())
+                        samples.append(filename)
+                        labels.append(manifest.get(f"{folder}/{filename.strip().split('/')[-1]}"))
+            problems = manifest.report()
+            if problems:
+                self.log(problems, LogLevel.ERROR)
+                self.update(state=op_state.ERROR)
             return samples, labels
 
         labels_folders = []
@@ -78,39 +96,78 @@ class ImgLoader(ConfigState.State):
             self.log(f"Loading {folder}...")
             for format in image_formats:
                 for filename in glob.glob(f'{ds_dir}/{folder}/*.{format}'):  # assuming gif
-                    samples.append(Image.open(filename))
+                    samples.append(filename)
                     labels.append(folder)
         return samples, labels
 
-    def image_preprocess(self, samples):
+    def image_preprocess(self, filenames):
+        """ Decodes, resizes, and crops all images in parallel into a single uint8 array.
+
+        Parameters
+        ----------
+        filenames: list
+
+        Returns
+        -------
+        numpy.array
+            images in (N, height, width, channels) shape, or an object array of images
+            if they have different sizes and neither resizing nor cropping is configured.
+        """
+        if len(filenames) == 0:
+            self.log("No image was found!", LogLevel.ERROR)
+            self.update(state=op_state.ERROR)
+            return np.empty((0,), dtype=np.uint8)
         resize, crop = self.config.get('image_resize', False), self.config.get('image_crop', False)
+        resize_dim, crop_box = None, None
         if resize:
             resize_dim = (resize['width'], resize['height'])
-            resized_samples = []
-            for sample in samples:
-                resized_samples.append(sample.resize(resize_dim))
-            samples = resized_samples
         if crop:
-            crop_sizes = (crop['x_coordinate'],
-                          crop['y_coordinate'],
-                          crop['width'],
-                          crop['height'])
-            cropped_samples = []
-            for sample in samples:
-                cropped_samples.append(sample.crop(crop_sizes))
-            samples = cropped_samples
-        return samples
+            # (left, upper, right, lower) box of PIL
+            crop_box = (crop['x_coordinate'],
+                        crop['y_coordinate'],
+                        crop['x_coordinate'] + crop['width'],
+                        crop['y_coordinate'] + crop['height'])
+        shape, mode = output_shape(filenames[0], resize_dim, crop_box)
+        data_file = self.load('output_files')['data'][0]
+        if 'labels' in self.load('output_files') and not in_memory():
+            # Dense output: images are streamed into the output file instead of memory
+            samples = np.lib.format.open_memmap(data_file, mode='w+', dtype=np.uint8, shape=(len(filenames), *shape))
+        else:
+            samples = np.empty((len(filenames), *shape), dtype=np.uint8)
+        options = dict(workers=self.config.get('workers', 1), executor=self.config.get('executor', 'thread'),
+                       progress=lambda done: self.update(progress=0.3 + 0.5 * done))
+        try:
+            return decode_images(filenames, samples, mode, resize_dim, crop_box, **options)
+        except ValueError as e:
+            if resize or crop:
+                raise
+            # Images of different sizes are kept as a list of arrays, as before preallocation
+            self.log(f"Images have different sizes; they are not stored in a single array\n{e}", LogLevel.DEBUG)
+            if isinstance(samples, np.memmap):
+                del samples
+                os.remove(data_file)
+            return decode_images(filenames, None, mode, resize_dim, crop_box, **options)
 
 
 @app_state(name='WriteResults', role=Role.BOTH)
+@instrument
 class WriteResults(AppState):
     def register(self):
         self.register_transition('terminal', Role.BOTH)
 
     def run(self) -> str or None:
-        samples = []
-        for sample in self.load('samples'):
-            samples.append(np.asarray(sample))
-        np.save(self.load('output_files')['data'][0], [samples, self.load('labels')])
+        samples = self.load('samples')
+        if samples is None:
+            self.update(progress=0.99)
+            return 'terminal'
+        if isinstance(samples, np.memmap):
+            samples.flush()
+            np.save(self.load('output_files')['labels'][0], label_array(self.load('labels')))
+        else:
+            output_files = self.load('output_files')
+            target = output_files['labels'][0] if 'labels' in output_files else 'same-sep'
+            save_numpy(output_files['data'][0], samples, label_array(self.load('labels')), target)
+        key, fingerprint, outputs = self.load('cache_entry')
+        self.load('manifest').record(key, fingerprint, outputs=outputs)
         self.update(progress=0.99)
         return 'terminal'
@@ -0,0 +1,249 @@
+"""
+    FeatureCloud Image Loader Application
+    Copyright 2021 Mohammad Bakhtiari. All Rights Reserved.
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+        http://www.apache.org/licenses/LICENSE-2.0
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numbers
+import posixpath
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+
+def output_shape(filename, resize_dim=None, crop_box=None):
+    """ Finds the shape of preprocessed images and their color mode based on the first image.
+
+    Parameters
+    ----------
+    filename: str
+        path to the first image
+    resize_dim: tuple
+        (width, height)
+    crop_box: tuple
+        (left, upper, right, lower) as expected by `PIL.Image.crop`
+
+    Returns
+    -------
+    shape: tuple
+        (height, width, channels)
+    mode: str
+        PIL color mode that all images will be converted to
+    """
+    with Image.open(filename) as img:
+        mode = img.mode
+        width, height = img.size
+    if resize_dim:
+        width, height = resize_dim
+    if crop_box:
+        width, height = crop_box[2] - crop_box[0], crop_box[3] - crop_box[1]
+    return (height, width, Image.getmodebands(mode)), mode
+
+
+def decode_image(filename, mode, resize_dim=None, crop_box=None):
+    """ Decodes, resizes, and crops a single image; the file handle is closed immediately.
+
+    Parameters
+    ----------
+    filename: str
+    mode: str
+        PIL color mode
+    resize_dim: tuple
+    crop_box: tuple
+
+    Returns
+    -------
+    numpy.array
+        uint8 array with (height, width, channels) shape
+    """
+    with Image.open(filename) as img:
+        if img.mode != mode:
+            img = img.convert(mode)
+        if resize_dim:
+            img = img.resize(resize_dim)
+        if crop_box:
+            img = img.crop(crop_box)
+        sample = np.asarray(img, dtype=np.uint8)
+    if sample.ndim == 2:
+        sample = sample[..., np.newaxis]
+    return sample
+
+
+def _decode_image(args):
+    return decode_image(*args)
+
+
+def decode_images(filenames, out, mode, resize_dim=None, crop_box=None, workers=1, executor='thread',
+                  progress=None):
+    """ Decodes images with a pool of workers and writes them straight into a preallocated array.
+
+    Parameters
+    ----------
+    filenames: list
+    out: numpy.array
+        preallocated uint8 array with (N, height, width, channels) shape, or None to collect images
+        of different sizes into an object array.
+    mode: str
+    resize_dim: tuple
+    crop_box: tuple
+    workers: int
+        number of threads or processes
+    executor: str
+        `thread` or `process`
+    progress: callable
+        will be called with the fraction of decoded images
+
+    Returns
+    -------
+    numpy.array
+        the `out` array
+
+    Raises
+    ------
+    ValueError
+        if an image does not fit into `out`, e.g., images of different sizes without resizing.
+    """
+    workers = max(int(workers), 1)
+    if out is None:
+        out = np.empty(len(filenames), dtype=object)
+    fixed_shape = out.dtype != object
+    tasks = ((filename, mode, resize_dim, crop_box) for filename in filenames)
+    report_every = max(len(filenames) // 100, 1)
+    pool = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool(max_workers=workers) as ex:
+        chunksize = max(len(filenames) // (workers * 4), 1) if executor == 'process' else 1
+        for i, sample in enumerate(ex.map(_decode_image, tasks, chunksize=chunksize)):
+            if fixed_shape and sample.shape != out.shape[1:]:
+                raise ValueError(f"{filenames[i]} has {sample.shape} shape instead of {out.shape[1:]}")
+            out[i] = sample
+            if progress is not None and (i + 1) % report_every == 0:
+                progress((i + 1) / len(filenames))
+    return out
+
+
+def label_array(labels):
+    """ Converts labels into a typed array, so that it can be loaded without pickling.
+        Missing labels (None) become NaN among numeric labels and empty strings otherwise.
+
+    Parameters
+    ----------
+    labels: list
+
+    Returns
+    -------
+    numpy.array
+    """
+    present = [label for label in labels if label is not None]
+    if all(isinstance(label, (numbers.Number, np.bool_)) for label in present):
+        if len(present) == len(labels):
+            return np.asarray(labels)
+        return np.array([np.nan if label is None else label for label in labels], dtype=np.float64)
+    return np.array(['' if label is None else str(label) for label in labels], dtype=str)
+
+
+class LabelManifest:
+    """ Hash index from relative paths of images to labels, which parses each labels file only once.
+        Labels can come from one global file or one file per folder; in the latter case,
+        names are prefixed with the folder name. Entries are keyed by their path relative to
+        the dataset directory, e.g., `0/4.jpeg`, so the same file name can be labelled in different folders;
+        plain names, without a folder, are only matched while they belong to images of a single folder.
+        Missing, duplicate, and ambiguous names are collected so that they can be reported at once.
+
+    Attributes
+    ----------
+    labels: dict
+        relative path, or plain name, of the image as key and its label as value
+    duplicates: list
+        paths that appeared more than once
+    missing: list
+        paths that were looked up but not found
+    ambiguous: list
+        paths of images that matched a plain name, which was already used for an image in another folder
+    """
+
+    def __init__(self):
+        self.labels = {}
+        self.duplicates = []
+        self.missing = []
+        self.ambiguous = []
+        self._plain_names = {}
+
+    def read(self, labels_file, sep=',', prefix=''):
+        """ Adds all entries of a labels file, with `name` and `label` columns, to the index.
+
+        Parameters
+        ----------
+        labels_file: str
+        sep: str
+        prefix: str
+            prefix of names, e.g., the folder name
+        """
+        df = pd.read_csv(labels_file, sep=sep, dtype={'name': str})
+        names = [_relative_path(prefix + name) for name in df['name'].str.strip()]
+        labels = df['label'].tolist()
+        index = dict(zip(names, labels))
+        if len(index) < len(names):
+            self.duplicates += pd.Index(names)[pd.Index(names).duplicated()].unique().tolist()
+        self.duplicates += [n for n in index if n in self.labels]
+        self.labels.update(index)
+
+    def get(self, path):
+        """ Looks up the label of an image by its relative path, with or without the file extension,
+            or otherwise by its plain name.
+
+        Parameters
+        ----------
+        path: str
+            path of the image relative to the dataset directory, e.g., `0/4.jpeg`
+
+        Returns
+        -------
+        label or None
+        """
+        path = _relative_path(path)
+        folder, name = posixpath.split(path)
+        for key in [path, posixpath.splitext(path)[0]]:
+            if key in self.labels:
+                return self.labels[key]
+        for key in [name, posixpath.splitext(name)[0]]:
+            if key in self.labels:
+                if self._plain_names.setdefault(key, folder) != folder:
+                    self.ambiguous.append(path)
+                return self.labels[key]
+        self.missing.append(path)
+        return None
+
+    def report(self, max_items=10):
+        """ Summarizes missing and duplicate entries
+
+        Parameters
+        ----------
+        max_items: int
+            maximum number of names to be listed for each problem
+
+        Returns
+        -------
+        str or None
+            None if there was no problem.
+        """
+        msg = ""
+        for title, names in [("missing", self.missing), ("duplicate", self.duplicates),
+                             ("ambiguous", self.ambiguous)]:
+            if names:
+                msg += f"{len(names)} {title} label entries: {', '.join(map(str, names[:max_items]))}" \
+                       f"{', ...' if len(names) > max_items else ''}\n"
+        return msg or None
+
+
+def _relative_path(name):
+    """ Normalizes a name of the labels file, e.g., `./0\\4.jpeg`, into a relative path, e.g., `0/4.jpeg`
+    """
+    return posixpath.normpath(name.replace('\\', '/'))
@@ -11,14 +11,14 @@
     See the License for the specific language governing permissions and
     limitations under the License.
 """
-import copy
-import os.path
+from functools import partial
 from FeatureCloud.app.engine.app import app_state, AppState, Role, LogLevel, SMPCOperation
 from FeatureCloud.app.engine.app import State as op_state
 import numpy as np
-from utils import save_numpy
-from .utils import read_file
+from .utils import split_sums, normalize_file, pooled_mean_std, label_files
 from CustomStates import ConfigState
+from CustomStates.Profiler import instrument
+from utils import file_exists, decode_smpc, log_data
 
 name = 'image_normalization'
 
@@ -37,8 +37,12 @@ class LocalStats(ConfigState.State):
         self.update(progress=0.1)
         self.store('method', self.config['method'])
         self.store('target_value', self.config['local_dataset']['target_value'])
+        self.store('dtype', self.config.get('dtype', 'float32'))
+        self.store('batch_size', self.config.get('batch_size', 1024))
         stats = self.read_files()
         self.store('smpc_used', self.config.get('use_smpc', False))
+        if self.load('smpc_used'):
+            stats = self.smpc_payload(stats)
         self.send_data_to_coordinator(data=stats, use_smpc=self.load('smpc_used'))
         self.update(progress=0.3)
         if self.is_coordinator:
@@ -46,67 +50,38 @@ class LocalStats(ConfigState.State):
         return 'WriteResults'
 
     def read_files(self):
-        x_train, y_train, x_test, y_test, local_stats = [], [], [], [], []
-        splits = zip(self.load('input_files')['train'], self.load('input_files')['test'])
-        for split_train_file, split_test_file in splits:
-            if not os.path.isfile(split_train_file):
+        target = self.config['local_dataset']['target_value']
+        train_files, test_files = self.load('input_files')['train'], list(self.load('input_files')['test'])
+        for i, (split_train_file, split_test_file) in enumerate(zip(train_files, test_files)):
+            if not file_exists(split_train_file):
                 self.log(f"File not found:\n{split_train_file}", LogLevel.ERROR)
                 self.update(state=op_state.ERROR)
-            x, y, mean_train, std_train = read_file(split_train_file,
-                                                                self.config['local_dataset']['target_value'])
-            n_train_samples = len(x)
-            mean_train *= n_train_samples
-            std_train *= n_train_samples
-            x_train.append(x)
-            y_train.append(y)
-            if not os.path.isfile(split_test_file):
+            if not file_exists(split_test_file):
                 self.log(f"File not found:\n{split_test_file}"
-                             f"\nNo test set is provided!", LogLevel.DEBUG)
-                mean_test, std_test = copy.deepcopy(mean_train), copy.deepcopy(std_train)
-                x, y = [], []
-            else:
-                x, y, mean_test, std_test = read_file(split_test_file)
-            n_test_samples = len(x)
-            mean_test *= n_test_samples
-            std_test *= n_test_samples
-
-            x_test.append(x)
-            y_test.append(y)
-            local_stats.append([[n_train_samples, mean_train.tolist(), std_train.tolist()],
-                                [n_test_samples, mean_test.tolist(), std_test.tolist()]])
-        self.store('x_train', x_train)
-        self.store('x_test', x_test)
-        self.store('y_train', y_train)
-        self.store('y_test', y_test)
-        return local_stats
+                         f"\nNo test set is provided!", LogLevel.DEBUG)
+                test_files[i] = None
+        return self.map_splits(partial(split_sums, target=target, batch_size=self.load('batch_size')),
+                               train_files, test_files, progress=(0.1, 0.3),
+                               cache='local_stats', sections=(self.config['local_dataset'], ))
 
 
 @app_state(name="GlobalStats", role=Role.COORDINATOR)
+@instrument
 class GlobalStats(AppState):
     def register(self):
         self.register_transition('WriteResults', Role.COORDINATOR)
 
     def run(self):
         aggregated_stats = self.aggregate_data(operation=SMPCOperation.ADD, use_smpc=self.load('smpc_used'))
-        print(aggregated_stats)
+        if self.load('smpc_used'):
+            aggregated_stats = decode_smpc(aggregated_stats, self.load('structure'), self.load('precision'))
+        log_data(aggregated_stats, self.log)
         self.update(progress=0.4)
         global_stats = []
         if self.load('method') == "variance":
             for train_split, test_split in aggregated_stats:
-                n_train_samples, train_mean, train_std = train_split
-                n_test_samples, test_mean, test_std = test_split
-                if n_train_samples != 0:
-                    train_mean = np.array(train_mean) / n_train_samples
-                    train_std = np.array(train_std) / n_train_samples
-                else:
-                    train_mean = np.array(train_mean) * 0
-                    train_std = np.array(train_std) * 0
-                if n_test_samples != 0:
-                    test_mean = np.array(test_mean) / n_test_samples
-                    test_std = np.array(test_std) / n_test_samples
-                else:
-                    test_mean = np.array(test_mean) * 0
-                    test_std = np.array(test_std) * 0
+                train_mean, train_std = pooled_mean_std(train_split)
+                test_mean, test_std = pooled_mean_std(test_split)
                 global_stats.append([train_mean, train_std, test_mean, test_std])
             self.broadcast_data(data=global_stats)
         else:
@@ -118,44 +93,42 @@ class GlobalStats(AppState):
 
 
 @app_state(name='WriteResults', role=Role.BOTH)
+@instrument
 class WriteResults(AppState):
     def register(self):
         self.register_transition('terminal', Role.BOTH)
 
     def run(self) -> str:
         global_stats = self.await_data(n=1, unwrap=True, is_json=False)
+        if self.load('method') != "variance":
+            self.log(f"{self.load('method')} was not implemented as a normalization method.", LogLevel.ERROR)
+            self.update(state=op_state.ACTION)
         progress = 0.5
         step = 0.5 / len(global_stats)
-        for i, split_stats in enumerate(global_stats):
-            x_train, x_test = \
-                self.local_normalization(self.load('x_train')[i], self.load('x_test')[i], split_stats)
-            self.write_results(x_train, x_test, i)
+        for i, (train_mean, train_std, test_mean, test_std) in enumerate(global_stats):
+            self.normalize('train', i, train_mean, train_std)
+            self.normalize('test', i, test_mean, test_std)
             progress += step
             self.update(progress=progress)
         self.update(progress=1.0)
         return 'terminal'
 
-    def local_normalization(self, x_train, x_test, global_stats):
-        if self.load('method') == "variance":
-            normalized_x_train = np.subtract(x_train, global_stats[0]) / global_stats[1]
-            if np.size(x_test) != 0:
-                normalized_x_test = np.subtract(x_test, global_stats[2]) / global_stats[3]
-            else:
-                normalized_x_test = np.array([])
-            return normalized_x_train.tolist(), normalized_x_test.tolist()
-
-        self.log(f"{self.conmethod} was not implemented as a normalization method.", LogLevel.ERROR)
-        self.update(state=op_state.ACTION)
-
-    def write_results(self, x_train, x_test, i):
-        save_numpy(file_name=self.load('output_files')['train'][i],
-                   features=x_train,
-                   labels=self.load('y_train')[i],
-                   target=self.load('target_value'),
-                   )
-        if np.size(x_test) != 0:
-            save_numpy(file_name=self.load('output_files')['test'][i],
-                       features=x_test,
-                       labels=self.load('y_test')[i],
-                       target=self.load('target_value')
-                       )
+    def normalize(self, key, i, mean, std):
+        filename = self.load('input_files')[key][i]
+        if not file_exists(filename):
+            return
+        output_file = self.load('output_files')[key][i]
+        manifest = self.load('manifest')
+        fingerprint = manifest.fingerprint(label_files(filename, self.load('target_value')),
+                                           np.asarray(mean).tolist(), np.asarray(std).tolist(), self.load('dtype'))
+        if manifest.lookup(f"normalize:{output_file}", fingerprint) is not None:
+            self.log(f"{output_file} is up to date")
+            return
+        normalize_file(filename=filename,
+                       output_file=output_file,
+                       target=self.load('target_value'),
+                       mean=mean,
+                       std=std,
+                       dtype=self.load('dtype'),
+                       batch_size=self.load('batch_size'))
+        manifest.record(f"normalize:{output_file}", fingerprint, outputs=[output_file])
@@ -1,30 +1,248 @@
+import itertools
+import os
 import numpy as np
-from utils import load_numpy
+from utils import load_numpy, save_numpy, in_memory
 
 
-def read_file(filename, target):
-    """ load a numpy file and compute mean and std. for each channel
+def load_features(filename, target, mmap_mode='r'):
+    """ load features and labels of a numpy file without copying the samples;
+        dense NumPy files will be memory-mapped, while arrays of Python objects, e.g., `same-sep` `.npy` files,
+        are loaded entirely.
     Parameters
     ----------
     filename: str
     target: str
+    mmap_mode: str
     Returns
     -------
+    x: array-like
+        indexable samples
+    y: array-like
+        labels
     """
-    data = load_numpy(filename)
+    data = load_numpy(filename, mmap_mode=mmap_mode)
     if target == "same-sep":
-        x, y = data
-        x = np.array(list(x))
+        x, y = data[0], data[1]
     elif target == 'same-last':
-        x = [s[-1] for s in data]
-        y = [s[-1] for s in data]
+        if data.dtype != object:
+            x, y = data[:, :-1], data[:, -1]
+        else:
+            x = [s[:-1] for s in data]
+            y = [s[-1] for s in data]
     elif '.npy' in target or '.npz' in target:
         x = data
-        y = np.load(target, allow_pickle=True)
-    x = np.array(list(x))
-    sample_shape = x[0].shape[1:]
-    if min(sample_shape) > 3:
-        x = np.expand_dims(x, axis=-1)
-    mean = np.mean(x, axis=tuple(range(x.ndim - 1)))
-    std = np.std(x, axis=tuple(range(x.ndim - 1)))
-    return x, y.tolist(), mean, std
+        y = load_numpy(os.path.join(os.path.dirname(filename), target))
+    return x, y
+
+
+def label_files(filename, target):
+    """ paths to a data file and, if labels are in a separate file, its labels file.
+    Parameters
+    ----------
+    filename: str
+    target: str
+    Returns
+    -------
+    list
+    """
+    if '.npy' in target or '.npz' in target:
+        return [filename, os.path.join(os.path.dirname(filename), target)]
+    return [filename]
+
+
+def expand_channels(x):
+    """ add a channel axis to samples without one, i.e., samples whose last dimension is larger than three.
+    Parameters
+    ----------
+    x: numpy.array
+        batch of samples
+    Returns
+    -------
+    numpy.array
+    """
+    if x.ndim <= 2 or x.shape[-1] > 3:
+        return np.expand_dims(x, axis=-1)
+    return x
+
+
+def iter_batches(x, batch_size, dtype=np.float64):
+    """ yield dense batches of samples with channel axis as the last one.
+    Parameters
+    ----------
+    x: array-like
+    batch_size: int
+    dtype: numpy.dtype
+    Returns
+    -------
+    """
+    for i in range(0, len(x), batch_size):
+        batch = x[i:i + batch_size]
+        if isinstance(batch, np.ndarray) and batch.dtype != object:
+            batch = batch.astype(dtype)
+        else:
+            batch = np.stack([np.asarray(s, dtype=dtype) for s in batch])
+        yield expand_channels(batch)
+
+
+def merge_stats(a, b):
+    """ merge two sets of per-channel (count, mean, M2) statistics using Chan et al. parallel algorithm
+    Parameters
+    ----------
+    a: tuple
+    b: tuple
+    Returns
+    -------
+    tuple
+        (count, mean, M2)
+    """
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return a
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / n)
+    m2 = m2_a + m2_b + delta ** 2 * (n_a * n_b / n)
+    return n, mean, m2
+
+
+def channel_stats(x, batch_size=1024):
+    """ compute per-channel count, mean, and M2(sum of squared deviations) in a single streaming pass;
+        only one batch of samples is in memory at a time.
+    Parameters
+    ----------
+    x: array-like
+    batch_size: int
+    Returns
+    -------
+    tuple
+        (count, mean, M2)
+    """
+    stats = (0, 0.0, 0.0)
+    for batch in iter_batches(x, batch_size):
+        values = batch.reshape(-1, batch.shape[-1])
+        mean = values.mean(axis=0)
+        m2 = np.square(values - mean).sum(axis=0)
+        stats = merge_stats(stats, (len(values), mean, m2))
+    return stats
+
+
+def to_sums(stats):
+    """ convert (count, mean, M2) statistics into per-channel (count, sum, sum of squares), which can be
+        aggregated by simple addition, e.g., through SMPC.
+    Parameters
+    ----------
+    stats: tuple
+    Returns
+    -------
+    numpy.array
+        (3, channels) array of count, sum, and sum of squares
+    """
+    count, mean, m2 = stats
+    mean, m2 = np.asarray(mean, dtype=np.float64), np.asarray(m2, dtype=np.float64)
+    return np.stack([np.full(mean.shape, count, dtype=np.float64), mean * count, m2 + count * mean ** 2])
+
+
+def pooled_mean_std(sums):
+    """ exact pooled mean and population standard deviation from aggregated (count, sum, sum of squares)
+    Parameters
+    ----------
+    sums: array-like
+        (3, channels) aggregated count, sum, and sum of squares
+    Returns
+    -------
+    mean: numpy.array
+    std: numpy.array
+    """
+    count, total, total_sq = np.asarray(sums, dtype=np.float64)
+    if np.all(count == 0):
+        return total * 0, total * 0
+    mean = total / count
+    variance = np.maximum(total_sq / count - mean ** 2, 0)
+    return mean, np.sqrt(variance)
+
+
+def read_file(filename, target, batch_size=1024):
+    """ stream a numpy file and compute count, mean, and M2 for each channel
+    Parameters
+    ----------
+    filename: str
+    target: str
+    batch_size: int
+    Returns
+    -------
+    n_samples: int
+    stats: tuple
+        (count, mean, M2)
+    """
+    x, _ = load_features(filename, target)
+    return len(x), channel_stats(x, batch_size)
+
+
+def split_sums(train_file, test_file, target, batch_size=1024):
+    """ aggregatable statistics of train and test files of a single split
+    Parameters
+    ----------
+    train_file: str
+    test_file: str or None
+        if None, zero statistics will be returned for the test set.
+    target: str
+    batch_size: int
+    Returns
+    -------
+    list
+        [train_sums, test_sums] as (3, channels) nested lists
+    """
+    _, train_stats = read_file(train_file, target, batch_size)
+    train_sums = to_sums(train_stats)
+    if test_file is None:
+        return [train_sums.tolist(), (train_sums * 0).tolist()]
+    _, test_stats = read_file(test_file, target, batch_size)
+    return [train_sums.tolist(), to_sums(test_stats).tolist()]
+
+
+def normalize_file(filename, output_file, target, mean, std, dtype='float32', batch_size=1024):
+    """ normalize samples of a numpy file batch by batch and write them into the output file.
+        Each batch is normalized in place with the output dtype; once labels are in a separate file,
+        `.npy` outputs are memory-mapped, so only one batch is in memory at a time. Otherwise, normalized samples
+        of the whole file are kept in memory and saved with `save_numpy`, e.g., as a pickled `same-sep` array.
+    Parameters
+    ----------
+    filename: str
+    output_file: str
+    target: str
+    mean: array-like
+        per-channel mean
+    std: array-like
+        per-channel standard deviation
+    dtype: str
+    batch_size: int
+    Returns
+    -------
+    """
+    x, y = load_features(filename, target)
+    if len(x) == 0:
+        return
+    dtype = np.dtype(dtype)
+    mean, std = np.asarray(mean, dtype=dtype), np.asarray(std, dtype=dtype)
+    batches = iter_batches(x, batch_size, dtype)
+    first = next(batches)
+    shape = (len(x), *first.shape[1:])
+    separate_labels = '.npy' in target or '.npz' in target
+    if separate_labels and output_file.strip().lower().endswith('.npy') and not in_memory():
+        out = np.lib.format.open_memmap(output_file, mode='w+', dtype=dtype, shape=shape)
+    else:
+        out = np.empty(shape, dtype=dtype)
+    start = 0
+    for batch in itertools.chain([first], batches):
+        np.subtract(batch, mean, out=batch)
+        np.divide(batch, std, out=batch)
+        out[start:start + len(batch)] = batch
+        start += len(batch)
+    if separate_labels:
+        target = os.path.join(os.path.dirname(output_file), target)
+    if isinstance(out, np.memmap):
+        out.flush()
+        np.save(target, np.asarray(y))
+    else:
+        save_numpy(output_file, out, np.asarray(y), target)
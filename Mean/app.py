@@ -11,13 +11,14 @@
     See the License for the specific language governing permissions and
     limitations under the License.
 """
-from FeatureCloud.app.engine.app import app_state, AppState, Role, SMPCOperation
-from utils import log_data, log_send_data, JsonSerializer
-import pandas as pd
+from functools import partial
+from FeatureCloud.app.engine.app import app_state, AppState, Role, SMPCOperation, LogLevel
+from FeatureCloud.app.engine.app import State as op_state
+from utils import log_data, log_send_data, decode_smpc
 import numpy as np
 from CustomStates import ConfigState
-
-js_serializer = JsonSerializer()
+from CustomStates.Profiler import instrument
+from .utils import split_stats
 
 name = 'mean'
 
@@ -34,25 +35,26 @@ class LocalMean(ConfigState.State):
         self.read_config()
         self.finalize_config()
         self.store('config', self.config)
-        local_mean = []
-        dfs = []
-        for file_name in self.load('input_files')['data']:
-            dfs.append(pd.read_csv(file_name))
-        for df in dfs:
-            if self.config['axis'] is None:
-                local_mean.append(df.mean().mean())
-            elif self.config['axis'] == 0:
-                local_mean.append(df.mean())
-            elif self.config['axis'] == 1:
-                local_mean.append([df.mean(), int(self.is_coordinator) * 2 + 100])
+        chunk_size = self.config['local_dataset'].get('chunk_size', None)
+        reader = self.config['local_dataset'].get('reader', None) or {}
+        try:
+            local_means = self.map_splits(partial(split_stats, axis=self.config['axis'], chunk_size=chunk_size,
+                                                  **reader),
+                                          self.load('input_files')['data'], progress=(0.0, 0.1), cache='local_stats',
+                                          sections=(self.config['local_dataset'], self.config['axis']))
+        except ValueError as e:
+            self.log(f"Local statistics cannot be computed:\n{e}", LogLevel.ERROR)
+            self.update(state=op_state.ERROR)
+            raise
 
         # By default, SMPC will not be used, unless end-user asks for it!
         self.store('smpc_used', self.config.get('use_smpc', False))
         if self.load('smpc_used'):
-            local_mean = js_serializer.prepare(local_mean)
-        self.send_data_to_coordinator(data=local_mean,
+            # One dense vector is secret-shared instead of nested lists; the coordinator restores the structure
+            local_means = self.smpc_payload(local_means)
+        self.send_data_to_coordinator(data=local_means,
                                       use_smpc=self.load('smpc_used'))
-        log_send_data(local_mean, self.log)
+        log_send_data(local_means, self.log)
 
         self.update(progress=0.1)
         if self.is_coordinator:
@@ -61,6 +63,7 @@ class LocalMean(ConfigState.State):
 
 
 @app_state('GlobalMean', Role.COORDINATOR)
+@instrument
 class GlobalMean(AppState):
 
     def register(self):
@@ -69,12 +72,11 @@ class GlobalMean(AppState):
     def run(self) -> str or None:
         global_mean = []
         aggregated_data = self.aggregate_data(operation=SMPCOperation.ADD, use_smpc=self.load('smpc_used'))
+        if self.load('smpc_used'):
+            aggregated_data = decode_smpc(aggregated_data, self.load('structure'), self.load('precision'))
         log_data(aggregated_data, self.log)
-        for split_data in aggregated_data:
-            if self.load('config')['axis'] == 1:
-                global_mean.append(np.array(split_data[0]) / split_data[1])
-            else:
-                global_mean.append(np.array(split_data) / len(self.clients))
+        for sums, counts in aggregated_data:
+            global_mean.append(np.array(sums) / np.array(counts))
             self.store('smpc_used', False)
         self.broadcast_data(data=global_mean)
         log_send_data(global_mean, self.log)
@@ -82,6 +84,7 @@ class GlobalMean(AppState):
 
 
 @app_state('WriteResults', Role.BOTH)
+@instrument
 class WriteResults(AppState):
 
     def register(self):
@@ -0,0 +1,90 @@
+"""
+    FeatureCloud Mean Application
+    Copyright 2021 Mohammad Bakhtiari. All Rights Reserved.
+    Licensed under the Apache License, Version 2.0 (the "License");
+    you may not use this file except in compliance with the License.
+    You may obtain a copy of the License at
+        http://www.apache.org/licenses/LICENSE-2.0
+    Unless required by applicable law or agreed to in writing, software
+    distributed under the License is distributed on an "AS IS" BASIS,
+    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+    See the License for the specific language governing permissions and
+    limitations under the License.
+"""
+import pandas as pd
+from utils import read_csv, read_csv_chunks, in_memory
+
+
+def read_csv_stats(file_name, chunk_size=None, **reader):
+    """ Reads a CSV file chunk by chunk and accumulates, for each numeric column,
+        the sum and the number of non-missing values. Only one chunk is kept in memory at a time.
+        Numeric columns are determined by the first chunk; all of them should be numeric in later chunks as well.
+
+    Parameters
+    ----------
+    file_name: str
+    chunk_size: int
+        number of rows to be parsed at once. If None, the whole file will be parsed as one chunk
+        with the shared CSV reader.
+    reader: dict
+        options of `utils.read_csv`; see `utils.read_csv_chunks` for options that are not supported with chunks.
+
+    Returns
+    -------
+    sums: pandas.Series
+    counts: pandas.Series
+
+    Raises
+    ------
+    ValueError
+        if a numeric column of the first chunk cannot be parsed as numbers in a later chunk,
+        or reader options are not supported with chunks.
+    """
+    if chunk_size and not in_memory(file_name):
+        chunks = read_csv_chunks(file_name, chunk_size, **reader)
+    else:
+        chunks = [read_csv(file_name, **reader)]
+    sums, counts, n_rows = None, None, 0
+    for chunk in chunks:
+        if sums is None:
+            chunk = chunk.select_dtypes(include='number')
+            sums, counts = chunk.sum(), chunk.count()
+        else:
+            chunk = chunk[sums.index]
+            non_numeric = chunk.columns[[not pd.api.types.is_numeric_dtype(t) for t in chunk.dtypes]]
+            if len(non_numeric) > 0:
+                raise ValueError(f"Numeric columns {', '.join(map(str, non_numeric))} of {file_name} include "
+                                 f"non-numeric values after row {n_rows}; set their dtype in `reader`, "
+                                 f"or clean the data.")
+            sums += chunk.sum()
+            counts += chunk.count()
+        n_rows += len(chunk)
+    return sums, counts
+
+
+def local_stats(sums, counts, axis):
+    """ Builds the local statistics that should be shared with the coordinator,
+        i.e., sum and number of values, so that the pooled mean can be computed exactly.
+
+    Parameters
+    ----------
+    sums: pandas.Series
+    counts: pandas.Series
+    axis: int or None
+        if None, sum and count over all columns will be returned, otherwise, per column.
+
+    Returns
+    -------
+    list
+        [sum, count]; per column, they are lists, so that statistics are JSON-serializable.
+    """
+    if axis is None:
+        return [float(sums.sum()), int(counts.sum())]
+    return [sums.tolist(), counts.tolist()]
+
+
+def split_stats(file_name, axis, chunk_size=None, **reader):
+    """ Local statistics of a single split; see `read_csv_stats` and `local_stats`.
+    """
+    sums, counts = read_csv_stats(file_name, chunk_size, **reader)
+    return local_stats(sums, counts, axis)
@@ -0,0 +1,180 @@
+"""
+    Throughput of companion apps on synthetic datasets, with a local stand-in for the FeatureCloud controller
+    that simulates several clients in one process. Runtime, peak memory, I/O, and traffic are recorded per app
+    and state (see `CustomStates.Profiler`), and appended as a JSON line to the results file
+    (`--output`, by default, `fc-benchmarks.jsonl` in the temporary directory), so that they can be compared
+    across versions. Each app is run in a separate process to isolate its peak memory;
+    as clients run in threads of that process, memory and I/O of a state cover all clients.
+
+    Usage (from the root of the repository):
+        python -m benchmarks.apps --apps mean cross_validation --clients 3 --rows 100000
+        python -m benchmarks.apps --apps image_loader image_normalization --images 1000 --smpc --output results.jsonl
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import bios
+from utils import APPS
+from benchmarks import datasets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(tempfile.gettempdir(), "fc-benchmarks.jsonl")
+
+
+def prepare_mean(input_dir, client, args, config):
+    datasets.make_csv(f"{input_dir}/data.csv", args.rows, args.features, seed=client)
+    config.update(use_smpc=args.smpc)
+
+
+def prepare_cross_validation(input_dir, client, args, config):
+    datasets.make_csv(f"{input_dir}/data.csv", args.rows, args.features, seed=client)
+    config['local_dataset']['target_value'] = str(args.features)
+    config.update(n_splits=args.folds)
+
+
+def prepare_data_distributor(input_dir, client, args, config):
+    if client == 0:
+        datasets.make_csv(f"{input_dir}/data.csv", args.rows * args.clients, args.features)
+    config['local_dataset']['target_value'] = str(args.features)
+    config.update(plot=False)
+
+
+def prepare_image_loader(input_dir, client, args, config):
+    datasets.make_images(f"{input_dir}/{config['local_dataset']['ds_dir']}", args.images,
+                         (args.image_size, args.image_size), seed=client)
+    size = dict(width=args.image_size, height=args.image_size)
+    config['image_resize'].update(size)
+    config['image_crop'].update(size)
+
+
+def prepare_image_normalization(input_dir, client, args, config):
+    shape = (args.image_size, args.image_size, 3)
+    datasets.make_numpy(f"{input_dir}/train.npy", args.images, shape, seed=client)
+    datasets.make_numpy(f"{input_dir}/test.npy", max(args.images // 4, 1), shape, seed=client + args.clients)
+    config.update(use_smpc=args.smpc)
+
+
+PREPARE = {'mean': prepare_mean,
+           'cross_validation': prepare_cross_validation,
+           'data_distributor': prepare_data_distributor,
+           'image_loader': prepare_image_loader,
+           'image_normalization': prepare_image_normalization}
+
+
+def run_app(app_name, args):
+    """ Generates datasets of all clients, runs the app with the fake controller, and summarizes profiler records
+
+    Returns
+    -------
+    dict
+    """
+    from benchmarks.controller import FakeController
+    from CustomStates.Profiler import profiler
+    package = APPS[app_name]
+    with tempfile.TemporaryDirectory() as root:
+        client_dirs = []
+        for client in range(args.clients):
+            input_dir, output_dir = f"{root}/client_{client}/input", f"{root}/client_{client}/output"
+            os.makedirs(input_dir)
+            os.makedirs(output_dir)
+            config = bios.read(f"{ROOT}/{package}/config.yml")
+            PREPARE[app_name](input_dir, client, args, config[app_name])
+            # States are only measured with profiling enabled
+            config[app_name]['profile'] = True
+            bios.write(f"{input_dir}/config.yml", config)
+            client_dirs.append((input_dir, output_dir))
+        controller = FakeController(package, client_dirs)
+        profiler.records.clear()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            wall_time = controller.run(args.timeout)
+    return {'app': app_name, 'wall_time': wall_time,
+            'peak_rss': max((r['peak_rss'] or 0 for r in profiler.records), default=None),
+            'bytes_sent': sum(t['sent'] for t in controller.traffic.values()),
+            'states': summarize_states(profiler.records)}
+
+
+def summarize_states(records):
+    """ Aggregates records of clients per state: the slowest client's wall time, total CPU time, I/O,
+        and traffic, and the highest peak memory.
+
+    Returns
+    -------
+    dict
+        state name as key and its summary as value
+    """
+    states = {}
+    for record in records:
+        summary = states.setdefault(record['state'], {'clients': 0, 'wall_time': 0.0, 'cpu_time': 0.0, 'peak_rss': 0,
+                                                      'bytes_read': 0, 'bytes_written': 0, 'bytes_sent': 0,
+                                                      'bytes_received': 0})
+        summary['clients'] += 1
+        summary['wall_time'] = max(summary['wall_time'], record['wall_time'])
+        summary['peak_rss'] = max(summary['peak_rss'], record['peak_rss'] or 0)
+        for key in ['cpu_time', 'bytes_read', 'bytes_written', 'bytes_sent', 'bytes_received']:
+            summary[key] += record[key] or 0
+    return states
+
+
+def run_isolated(app_name, argv):
+    """ Runs the benchmark of a single app in a new process and returns its result
+    """
+    proc = subprocess.run([sys.executable, '-m', 'benchmarks.apps', *argv, '--apps', app_name, '--child'],
+                          cwd=ROOT, stdout=subprocess.PIPE, check=True, text=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', nargs='+', default=list(PREPARE), choices=list(PREPARE))
+    parser.add_argument('--clients', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=10000, help="rows of CSV files per client")
+    parser.add_argument('--features', type=int, default=10, help="number of features of CSV files")
+    parser.add_argument('--folds', type=int, default=5, help="number of folds of cross validation")
+    parser.add_argument('--images', type=int, default=200, help="number of images per client")
+    parser.add_argument('--image-size', type=int, default=28)
+    parser.add_argument('--smpc', action='store_true', help="aggregate through (simulated) SMPC, if supported")
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--output', default=RESULTS, help="JSON lines file that results are appended to")
+    parser.add_argument('--verbose', action='store_true', help="show logs of the apps")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_app(args.apps[0], args)))
+        return
+    argv = []
+    for key, value in vars(args).items():
+        if key not in ['apps', 'output', 'child'] and value is not False:
+            argv += [f"--{key.replace('_', '-')}"] + ([] if value is True else [str(value)])
+    results = []
+    for app_name in args.apps:
+        result = run_isolated(app_name, argv)
+        results.append(result)
+        peak_rss = (result['peak_rss'] or 0) / 2 ** 20
+        print(f"{app_name:<20} wall: {result['wall_time']:.3f}s  peak RSS: {peak_rss:.1f} MiB  "
+              f"sent: {result['bytes_sent'] / 2 ** 10:.1f} KiB")
+        for state, summary in result['states'].items():
+            print(f"    {state:<16} wall: {summary['wall_time']:.3f}s  cpu: {summary['cpu_time']:.3f}s  "
+                  f"peak RSS: {summary['peak_rss'] / 2 ** 20:.1f} MiB")
+    parameters = {k: v for k, v in vars(args).items() if k not in ['output', 'verbose', 'child', 'timeout']}
+    with open(args.output, 'a') as f:
+        f.write(json.dumps({'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                            'revision': revision(), 'python': sys.version.split()[0],
+                            'parameters': parameters, 'results': results}) + "\n")
+    print(f"Results are appended to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+    In-process stand-in for the FeatureCloud controller, which runs one instance of a companion app per simulated client
+    and routes their messages, so that apps can be benchmarked without Docker and a real controller.
+"""
+import json
+import time
+import numpy as np
+from FeatureCloud.app.engine import app as engine
+from CustomStates.ConfigState import State as ConfigState
+from workflow import import_states
+
+
+class FakeController:
+    """
+    Runs the same app for several clients in threads of the current process, like the controller does in containers.
+    Outgoing data of clients is routed the same way:
+        - data with a destination is delivered to that client, e.g., `send_data_to_participant`.
+        - data of the coordinator without a destination is broadcast to all other clients.
+        - data of other clients is delivered to the coordinator, e.g., `send_data_to_coordinator`.
+        - SMPC data of all clients is added, after rounding to the configured exponent, and the sum is delivered
+          to the coordinator; no secret-sharing takes place.
+
+    Attributes
+    ----------
+    clients: list
+        IDs of clients; the first one is the coordinator.
+    apps: dict
+        client ID as key and its FeatureCloud app as value
+    traffic: dict
+        client ID as key and number of bytes it sent and received as value
+
+    Methods
+    -------
+    run(timeout=600)
+    """
+
+    def __init__(self, package, client_dirs, poll_interval=0.001):
+        """
+        Parameters
+        ----------
+        package: str
+            package of the app, e.g., `Mean`
+        client_dirs: list
+            (input_dir, output_dir) of each client
+        poll_interval: float
+            seconds between routing rounds when no client has data to send
+        """
+        self.clients = [str(i) for i in range(len(client_dirs))]
+        self.coordinator = self.clients[0]
+        self.poll_interval = poll_interval
+        self.apps = {}
+        self.traffic = {client: {'sent': 0, 'received': 0} for client in self.clients}
+        self._smpc = []
+        for client, (input_dir, output_dir) in zip(self.clients, client_dirs):
+            states = import_states(package)
+            for state in states.values():
+                if isinstance(state, ConfigState):
+                    state.input_dir, state.output_dir = input_dir, output_dir
+                    state.config_file = f"{input_dir}/config.yml"
+            app = states['terminal']._app
+            app.register()
+            self.apps[client] = app
+
+    def run(self, timeout=600):
+        """ Sets up all clients and routes their messages until all of them are finished
+
+        Returns
+        -------
+        float
+            wall time in seconds
+        """
+        waits = engine.TRANSITION_WAIT, engine.TERMINAL_WAIT, engine.DATA_POLL_INTERVAL
+        engine.TRANSITION_WAIT, engine.TERMINAL_WAIT, engine.DATA_POLL_INTERVAL = 0, 0, self.poll_interval
+        start = time.perf_counter()
+        try:
+            for client, app in self.apps.items():
+                app.handle_setup(client, client == self.coordinator, list(self.clients))
+            while not all(app.status_finished for app in self.apps.values()):
+                for client, app in self.apps.items():
+                    if app.status_state == engine.State.ERROR.value:
+                        raise RuntimeError(f"Client {client} failed in {app.current_state.name}: {app.status_message}")
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"Clients did not finish within {timeout} seconds")
+                if not self.route():
+                    time.sleep(self.poll_interval)
+            for app in self.apps.values():
+                app.thread.join()
+            return time.perf_counter() - start
+        finally:
+            engine.TRANSITION_WAIT, engine.TERMINAL_WAIT, engine.DATA_POLL_INTERVAL = waits
+
+    def route(self):
+        """ Collects outgoing data of all clients and delivers it
+
+        Returns
+        -------
+        bool
+            whether any data was routed
+        """
+        routed = False
+        for client, app in self.apps.items():
+            while app.data_outgoing:
+                _, use_smpc, destination = app.data_outgoing[0]
+                exponent = app.default_smpc['exponent']
+                data = app.handle_outgoing()
+                self.traffic[client]['sent'] += len(data)
+                routed = True
+                if destination is not None:
+                    self.deliver(destination, data, client)
+                elif use_smpc:
+                    self._smpc.append(json.loads(data))
+                    if len(self._smpc) == len(self.clients):
+                        self.deliver(self.coordinator, json.dumps(smpc_add(self._smpc, exponent)), client)
+                        self._smpc = []
+                elif client == self.coordinator:
+                    for other in self.clients:
+                        if other != client:
+                            self.deliver(other, data, client)
+                else:
+                    self.deliver(self.coordinator, data, client)
+        return routed
+
+    def deliver(self, client, data, sender):
+        self.traffic[client]['received'] += len(data)
+        self.apps[client].handle_incoming(data, sender)
+
+
+def smpc_add(payloads, exponent):
+    """ Adds payloads of all clients as fixed-point numbers with `exponent` decimal digits, like SMPC does
+
+    Parameters
+    ----------
+    payloads: list
+        one (nested) list of numbers per client
+    exponent: int
+
+    Returns
+    -------
+    list
+    """
+    scale = 10 ** exponent
+    total = np.sum([np.rint(np.asarray(p, dtype=np.float64) * scale).astype(np.int64) for p in payloads], axis=0)
+    return (total if exponent == 0 else total / scale).tolist()
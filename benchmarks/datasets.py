@@ -0,0 +1,67 @@
+"""
+    Synthetic datasets for benchmarking companion apps: CSV tables, NumPy datasets, and folders of JPEG images.
+    All generators are deterministic for a given seed.
+"""
+import os
+import numpy as np
+import pandas as pd
+from utils import save_numpy
+
+
+def make_csv(file_name, n_rows, n_features=10, n_classes=2, sep=',', seed=0):
+    """ Writes a table of normally distributed features, named `0` to `n_features - 1`,
+        and a class label, named `n_features`, which is the default target of the apps.
+
+    Parameters
+    ----------
+    file_name: str
+    n_rows: int
+    n_features: int
+    n_classes: int
+    sep: str
+    seed: int
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n_rows, n_features)), columns=[str(i) for i in range(n_features)])
+    df[str(n_features)] = rng.integers(0, n_classes, n_rows)
+    df.to_csv(file_name, sep=sep, index=False)
+
+
+def make_numpy(file_name, n_samples, shape=(28, 28, 3), n_classes=2, seed=0):
+    """ Writes a dataset of images with `uint8` pixel values, and their labels, in `same-sep` format;
+        see `utils.save_numpy`.
+
+    Parameters
+    ----------
+    file_name: str
+        `.npy` or `.npz` file
+    n_samples: int
+    shape: tuple
+        shape of each sample
+    n_classes: int
+    seed: int
+    """
+    rng = np.random.default_rng(seed)
+    features = rng.integers(0, 256, (n_samples, *shape), dtype=np.uint8)
+    save_numpy(file_name, features, rng.integers(0, n_classes, n_samples), "same-sep")
+
+
+def make_images(ds_dir, n_images, size=(28, 28), n_classes=2, seed=0):
+    """ Writes RGB JPEG images into one sub-directory per class, i.e., `target_value: dir` of the ImageLoader app.
+
+    Parameters
+    ----------
+    ds_dir: str
+    n_images: int
+    size: tuple
+        width and height
+    n_classes: int
+    seed: int
+    """
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    for c in range(n_classes):
+        os.makedirs(f"{ds_dir}/{c}", exist_ok=True)
+    for i in range(n_images):
+        pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(f"{ds_dir}/{i % n_classes}/{i}.jpeg")
@@ -0,0 +1,84 @@
+"""
+    Startup time of companion apps: time until the server accepts connections and
+    time until the app is registered and answers the first status request.
+
+    Usage (from the root of the repository):
+        python -m benchmarks.startup --apps mean data_distributor --repeats 3
+        python -m benchmarks.startup --eager   # import the app before starting the server, as before
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY = "import utils; utils.run(port={port}, app_name='{app}')"
+EAGER = "import importlib, utils; importlib.import_module(utils.select_app('{app}') + '.app'); " \
+        "utils.run(port={port}, app_name='{app}')"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=120):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if condition():
+                return
+        except OSError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError
+
+
+def measure(app, eager=False):
+    """ Starts the server in a new process and measures startup times in seconds
+
+    Returns
+    -------
+    dict
+        `listening`: until the server accepts connections.
+        `ready`: until the status request is answered, i.e., the app is registered.
+    """
+    port = free_port()
+    code = (EAGER if eager else LAZY).format(port=port, app=app)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(lambda: socket.create_connection(('localhost', port), timeout=0.1).close() or True)
+        listening = time.perf_counter() - start
+        wait_for(lambda: urllib.request.urlopen(f'http://localhost:{port}/api/status', timeout=120).status == 200)
+        ready = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {'listening': listening, 'ready': ready}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--apps', nargs='+', default=['mean', 'cross_validation', 'data_distributor',
+                                                      'image_loader', 'image_normalization'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--eager', action='store_true')
+    args = parser.parse_args()
+    results = {}
+    for app in args.apps:
+        runs = [measure(app, args.eager) for _ in range(args.repeats)]
+        results[app] = {k: min(r[k] for r in runs) for k in ['listening', 'ready']}
+        print(f"{app:<20} listening: {results[app]['listening']:.3f}s  ready: {results[app]['ready']:.3f}s")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from utils import run
-from Mean import app # noqa # pylint: disable=unused-import
 
 if __name__ == '__main__':
+    # The app is selected by `FC_APP` environment variable or the config file, and registered in the background
     run()
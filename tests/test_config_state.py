@@ -0,0 +1,30 @@
+import pytest
+from FeatureCloud.app.engine.app import App
+from CustomStates.ConfigState import State
+
+
+class LocalState(State):
+    def register(self):
+        pass
+
+    def run(self):
+        pass
+
+
+@pytest.fixture
+def state():
+    state = LocalState('test')
+    state._app = App()
+    state._app.clients = ['1', '2']
+    return state
+
+
+def test_smpc_payload_restores_float_exponent(state):
+    state.config = {'fixed_point': {'enabled': True, 'precision': 3}}
+    assert state.smpc_payload([1.5, [2, 3]]) == [1500, 2000, 3000]
+    assert state._app.default_smpc['exponent'] == 0
+    # A following app in the same workflow, without fixed point, shares the SMPC configuration
+    state.config = {}
+    assert state.smpc_payload([1.5, [2, 3]]) == [1.5, 2.0, 3.0]
+    assert state._app.default_smpc['exponent'] == 8
+    assert state.load('precision') is None
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from sklearn.model_selection import KFold, StratifiedKFold, RepeatedStratifiedKFold, GroupKFold, TimeSeriesSplit
+from CrossValidation.utils import fold_assignments, fold_indices
+
+N_SAMPLES, N_SPLITS = 23, 4
+y = np.arange(N_SAMPLES) % 3
+groups = np.arange(N_SAMPLES) // 2
+
+
+def sklearn_assignments(cv, n_repeats=1, **kwargs):
+    assignments = np.empty((n_repeats, N_SAMPLES), dtype=np.int32)
+    for i, (_, test) in enumerate(cv.split(np.zeros(N_SAMPLES), **kwargs)):
+        assignments[i // N_SPLITS, test] = i % N_SPLITS
+    return assignments
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_kfold_matches_sklearn(shuffle):
+    expected = sklearn_assignments(KFold(N_SPLITS, shuffle=shuffle, random_state=7 if shuffle else None))
+    actual = fold_assignments(N_SAMPLES, N_SPLITS, 'kfold', shuffle=shuffle, random_state=7)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_stratified_matches_sklearn():
+    expected = sklearn_assignments(StratifiedKFold(N_SPLITS, shuffle=True, random_state=7), y=y)
+    actual = fold_assignments(N_SAMPLES, N_SPLITS, 'stratified', y=y, shuffle=True, random_state=7)
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_repeated_stratified_matches_sklearn():
+    expected = sklearn_assignments(RepeatedStratifiedKFold(n_splits=N_SPLITS, n_repeats=3, random_state=7), 3, y=y)
+    actual = fold_assignments(N_SAMPLES, N_SPLITS, 'repeated_stratified', y=y, n_repeats=3, random_state=7)
+    np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize('cv_type', ['group', 'stratified_group'])
+def test_groups_stay_in_one_fold(cv_type):
+    assignments = fold_assignments(N_SAMPLES, N_SPLITS, cv_type, y=y, groups=groups, shuffle=True, random_state=0)
+    for group in np.unique(groups):
+        assert len(np.unique(assignments[0][groups == group])) == 1
+    assert set(assignments[0]) == set(range(N_SPLITS))
+
+
+def test_group_fold_sizes_are_balanced():
+    assignments = fold_assignments(N_SAMPLES, N_SPLITS, 'group', groups=groups)[0]
+    expected = [len(test) for _, test in GroupKFold(N_SPLITS).split(np.zeros(N_SAMPLES), groups=groups)]
+    assert sorted(np.bincount(assignments)) == sorted(expected)
+
+
+def test_time_series_matches_sklearn():
+    assignment = fold_assignments(N_SAMPLES, N_SPLITS, 'time_series')[0]
+    for fold, (train, test) in enumerate(TimeSeriesSplit(N_SPLITS).split(np.zeros(N_SAMPLES))):
+        actual_train, actual_test = fold_indices(assignment, fold, 'time_series')
+        assert actual_train.tolist() == train.tolist()
+        assert actual_test.tolist() == test.tolist()
+
+
+def test_time_series_needs_more_samples_than_splits():
+    with pytest.raises(ValueError):
+        fold_assignments(N_SPLITS, N_SPLITS, 'time_series')
+
+
+def test_time_series_cannot_be_repeated():
+    with pytest.raises(ValueError):
+        fold_assignments(N_SAMPLES, N_SPLITS, 'time_series', n_repeats=2)
+
+
+@pytest.mark.parametrize('cv_type', ['group', 'stratified_group'])
+def test_grouped_folds_need_enough_groups(cv_type):
+    with pytest.raises(ValueError):
+        fold_assignments(6, 5, cv_type, y=[0, 1] * 3, groups=[1, 1, 1, 2, 2, 2])
+
+
+def test_fold_indices_partition_samples():
+    assignment = fold_assignments(N_SAMPLES, N_SPLITS, 'kfold')[0]
+    for fold in range(N_SPLITS):
+        train, test = fold_indices(assignment, fold)
+        assert sorted(np.concatenate([train, test]).tolist()) == list(range(N_SAMPLES))
+        assert (assignment[test] == fold).all()
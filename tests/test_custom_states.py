@@ -0,0 +1,149 @@
+import os
+import pytest
+from CustomStates import Profiler as profiling
+from CustomStates.Manifest import Manifest
+from CustomStates.SplitPlan import SplitPlan
+
+
+@pytest.fixture
+def files(tmp_path):
+    input_file, output_file = tmp_path / "data.csv", tmp_path / "out.csv"
+    input_file.write_text("a,b\n1,2\n")
+    output_file.write_text("done")
+    return str(input_file), str(output_file)
+
+
+@pytest.mark.parametrize('method', ['stat', 'content'])
+def test_manifest_reuses_unchanged_work(tmp_path, files, method):
+    input_file, output_file = files
+    manifest = Manifest(str(tmp_path / ".manifest.json"), method)
+    fingerprint = manifest.fingerprint([input_file], {'sep': ','})
+    assert manifest.lookup('step', fingerprint) is None
+    manifest.record('step', fingerprint, outputs=[output_file], result=[1, 2])
+    # A rerun loads the persisted entries
+    manifest = Manifest(str(tmp_path / ".manifest.json"), method)
+    assert manifest.lookup('step', manifest.fingerprint([input_file], {'sep': ','}))['result'] == [1, 2]
+    assert manifest.lookup('step', manifest.fingerprint([input_file], {'sep': ';'})) is None
+
+
+@pytest.mark.parametrize('method', ['stat', 'content'])
+def test_manifest_invalidates_changed_input(tmp_path, files, method):
+    input_file, output_file = files
+    manifest = Manifest(str(tmp_path / ".manifest.json"), method)
+    manifest.record('step', manifest.fingerprint([input_file]), outputs=[output_file])
+    with open(input_file, 'a') as f:
+        f.write("3,4\n")
+    assert manifest.lookup('step', manifest.fingerprint([input_file])) is None
+
+
+def test_manifest_invalidates_missing_output(tmp_path, files):
+    input_file, output_file = files
+    manifest = Manifest(str(tmp_path / ".manifest.json"))
+    fingerprint = manifest.fingerprint([input_file])
+    manifest.record('step', fingerprint, outputs=[output_file])
+    assert manifest.lookup('step', fingerprint) is not None
+    os.remove(output_file)
+    assert manifest.lookup('step', fingerprint) is None
+
+
+def test_disabled_manifest_does_not_fingerprint_or_record(tmp_path, files, monkeypatch):
+    input_file, output_file = files
+    manifest = Manifest(str(tmp_path / ".manifest.json"), 'content', enabled=False)
+    monkeypatch.setattr(os, 'stat', lambda *args, **kwargs: pytest.fail("input files should not be accessed"))
+    fingerprint = manifest.fingerprint([input_file], {'sep': ','})
+    assert fingerprint is None
+    manifest.record('step', fingerprint, outputs=[output_file])
+    monkeypatch.undo()
+    assert manifest.lookup('step', fingerprint) is None
+    assert not os.path.exists(tmp_path / ".manifest.json")
+
+
+@pytest.fixture
+def split_dirs(tmp_path):
+    input_dir, output_dir = tmp_path / "input", tmp_path / "output"
+    for split in ['s2', 's1']:
+        os.makedirs(input_dir / "data" / split)
+    os.makedirs(output_dir)
+    return dict(input_dir=str(input_dir), output_dir=str(output_dir), mode='directory', dir='data',
+                local_dataset={'data': 'data.csv'}, result={'data': 'out.csv'})
+
+
+def test_split_plan_paths(split_dirs):
+    plan = SplitPlan.build(**split_dirs)
+    input_dir, output_dir = split_dirs['input_dir'], split_dirs['output_dir']
+    assert plan.splits == [f"{input_dir}/data/s1", f"{input_dir}/data/s2"]
+    assert plan.output_split(plan.splits[1]) == f"{output_dir}/data/s2"
+    assert plan.input_file('data', plan.splits[0]) == f"{input_dir}/data/s1/data.csv"
+    assert plan.output_file('data', plan.splits[0]) == f"{output_dir}/data/s1/out.csv"
+
+
+def test_split_plan_is_reused_until_config_or_splits_change(tmp_path, split_dirs):
+    plan_file = str(tmp_path / ".split_plan.json")
+    SplitPlan.build(**split_dirs).save(plan_file)
+    plan = SplitPlan.load(plan_file)
+    assert plan.matches(**split_dirs)
+    assert plan.input_file('data', plan.splits[1]).endswith("s2/data.csv")
+    assert not plan.matches(**{**split_dirs, 'result': {'data': 'other.csv'}})
+    assert not plan.matches(**{**split_dirs, 'output_dir': str(tmp_path)})
+    # Adding a split changes the modification time of the directory of splits
+    root = os.path.join(split_dirs['input_dir'], 'data')
+    os.makedirs(os.path.join(root, 's3'))
+    os.utime(root, ns=(0, 0))
+    assert not plan.matches(**split_dirs)
+    assert len(SplitPlan.build(**split_dirs).splits) == 3
+
+
+def test_split_plan_load_rejects_invalid_files(tmp_path):
+    assert SplitPlan.load(str(tmp_path / "missing.json")) is None
+    (tmp_path / "plan.json").write_text("{")
+    assert SplitPlan.load(str(tmp_path / "plan.json")) is None
+
+
+class FakeApp:
+    id = '1'
+
+    def handle_incoming(self, data, client):
+        pass
+
+    def handle_outgoing(self):
+        return b'data'
+
+
+@profiling.instrument
+class ProfiledState:
+    name, id, profile = 'state', '1', False
+
+    def __init__(self):
+        self._app = FakeApp()
+
+    def run(self):
+        # like `read_config`
+        profiling.profiler.enabled = self.profile
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = profiling.Profiler()
+    monkeypatch.setattr(profiling, 'profiler', profiler)
+    return profiler
+
+
+def test_disabled_profiler_does_not_measure(profiler, monkeypatch):
+    state = ProfiledState()
+    state.run()
+    # The record of the state that found profiling disabled is dropped, and traffic is not counted anymore
+    assert profiler.records == [] and profiler._current == {}
+    assert not getattr(state._app, '_profiled', False)
+    monkeypatch.setattr(profiling, '_reset_peak_rss', lambda: pytest.fail("peak RSS should not be reset"))
+    state.run()
+    assert profiler.records == []
+
+
+def test_enabled_profiler_records_states(profiler, tmp_path):
+    profiler.output_dir = str(tmp_path)
+    state = ProfiledState()
+    state.profile = True
+    state.run()
+    assert state._app.handle_outgoing() == b'data'
+    assert [(r['state'], r['bytes_sent']) for r in profiler.records] == [('state', 4)]
+    assert os.path.isfile(tmp_path / "profile.csv")
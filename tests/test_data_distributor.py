@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+from DataDistributor.utils import supervised_iid_sampling, noniid_sampling, dirichlet_sampling, chunk_index, \
+    shuffled_ranks, partition_indices, split_chunks, encode_partition, decode_partition
+
+CLIENTS = ['a', 'b', 'c']
+
+
+def dataset(n_samples=60, n_labels=3):
+    return pd.DataFrame({'x': np.arange(n_samples), 'label': np.arange(n_samples) % n_labels})
+
+
+def test_chunk_index_puts_remainder_into_last_chunk():
+    ranks = np.arange(7)
+    assert chunk_index(ranks, np.full(7, 7), 3).tolist() == [0, 0, 1, 1, 2, 2, 2]
+    # Groups smaller than the number of chunks go to the last chunk
+    assert chunk_index(np.arange(2), np.full(2, 2), 3).tolist() == [2, 2]
+
+
+def test_shuffled_ranks_are_permutations_within_labels():
+    codes = np.array([0, 1, 0, 2, 1, 0])
+    ranks, sizes = shuffled_ranks(codes, np.random.default_rng(0))
+    assert sizes.tolist() == [3, 2, 1]
+    for code, size in enumerate(sizes):
+        assert sorted(ranks[codes == code]) == list(range(size))
+
+
+def test_supervised_iid_sampling_balances_labels():
+    df = supervised_iid_sampling(dataset(), CLIENTS, np.random.default_rng(0))
+    counts = pd.crosstab(df.ASSIGNED_CLIENT, df.label)
+    assert (counts.to_numpy() == 20 // len(CLIENTS)).sum() == 6
+    assert counts.sum().tolist() == [20, 20, 20]
+
+
+def test_sampling_is_reproducible_with_seed():
+    first = supervised_iid_sampling(dataset(), CLIENTS, np.random.default_rng(1)).ASSIGNED_CLIENT
+    second = supervised_iid_sampling(dataset(), CLIENTS, np.random.default_rng(1)).ASSIGNED_CLIENT
+    assert first.tolist() == second.tolist()
+
+
+@pytest.mark.parametrize('noniid', [1, 2, 3])
+def test_noniid_sampling_limits_clients_per_label(noniid):
+    df = noniid_sampling(dataset(), CLIENTS, noniid, np.random.default_rng(0))
+    assert df.groupby('label').ASSIGNED_CLIENT.nunique().max() <= noniid
+    assert df.ASSIGNED_CLIENT.notna().all()
+
+
+@pytest.mark.parametrize('sampling, args', [(supervised_iid_sampling, ()), (noniid_sampling, (2,)),
+                                            (dirichlet_sampling, (0.5,))])
+def test_samples_without_label_are_not_assigned(sampling, args):
+    df = dataset().astype({'label': float})
+    df.loc[[0, 4, 8], 'label'] = np.nan
+    df = sampling(df, CLIENTS, *args, rng=np.random.default_rng(0))
+    assert df.ASSIGNED_CLIENT.isna().tolist() == df.label.isna().tolist()
+    partitions = partition_indices(df.ASSIGNED_CLIENT.to_numpy(), CLIENTS)
+    assert sum(len(p) for p in partitions.values()) == len(df) - 3
+
+
+@pytest.mark.parametrize('quantity_skew', [0, 1])
+def test_dirichlet_sampling_assigns_every_sample_once(quantity_skew):
+    df = dirichlet_sampling(dataset(300), CLIENTS, 0.5, quantity_skew, np.random.default_rng(0))
+    assert df.ASSIGNED_CLIENT.isin(CLIENTS).all()
+    assert df.groupby('label').size().tolist() == [100, 100, 100]
+
+
+def test_dirichlet_sampling_heterogeneity_grows_as_alpha_shrinks():
+    def label_spread(alpha):
+        df = dirichlet_sampling(dataset(3000), CLIENTS, alpha, rng=np.random.default_rng(0))
+        shares = pd.crosstab(df.label, df.ASSIGNED_CLIENT, normalize='index')
+        return shares.std(axis=1).mean()
+
+    assert label_spread(0.1) > label_spread(100)
+    assert label_spread(100) < 0.05
+
+
+def test_partition_indices_groups_positions_by_client():
+    partitions = partition_indices(np.array(['b', 'a', None, 'b'], dtype=object), CLIENTS)
+    assert {k: v.tolist() for k, v in partitions.items()} == {'a': [1], 'b': [0, 3], 'c': []}
+
+
+@pytest.mark.parametrize('chunk_size, sizes', [(None, [10]), (20, [10]), (4, [4, 3, 3]), (5, [5, 5])])
+def test_split_chunks(chunk_size, sizes):
+    chunks = split_chunks(np.arange(10), chunk_size)
+    assert [len(c) for c in chunks] == sizes
+    assert np.concatenate(chunks).tolist() == list(range(10))
+
+
+def test_split_chunks_keeps_an_empty_chunk():
+    assert [len(c) for c in split_chunks(np.arange(0), 3)] == [0]
+
+
+def test_partition_round_trip():
+    df = pd.DataFrame({'features': [np.full((2, 2), i, dtype=np.uint8) for i in range(3)],
+                       'label': ['x', 'y', 'x'], 7: [0.5, 1.5, 2.5]})
+    decoded = decode_partition(encode_partition(df), columns=df.columns.tolist())
+    assert decoded.columns.tolist() == ['features', 'label', 7]
+    assert decoded.label.tolist() == ['x', 'y', 'x']
+    assert decoded[7].tolist() == [0.5, 1.5, 2.5]
+    assert all(np.array_equal(a, b) for a, b in zip(decoded.features, df.features))
+    assert decode_partition(encode_partition(df)).columns.tolist() == ['features', 'label', '7']
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from PIL import Image
+from ImageLoader.utils import output_shape, decode_images, label_array, LabelManifest
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = np.random.default_rng(0)
+    filenames = []
+    for i, (width, height) in enumerate([(20, 10), (30, 40), (20, 10)]):
+        filenames.append(str(tmp_path / f"{i}.png"))
+        Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)).save(filenames[-1])
+    return filenames
+
+
+def test_output_shape_of_crop_box(images):
+    assert output_shape(images[0]) == ((10, 20, 3), 'RGB')
+    assert output_shape(images[0], resize_dim=(8, 6)) == ((6, 8, 3), 'RGB')
+    assert output_shape(images[0], crop_box=(2, 3, 7, 7)) == ((4, 5, 3), 'RGB')
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_decode_images_crops_box(images, executor):
+    crop_box = (2, 3, 7, 7)
+    shape, mode = output_shape(images[0], crop_box=crop_box)
+    out = decode_images(images, np.empty((len(images), *shape), dtype=np.uint8), mode, crop_box=crop_box,
+                        workers=2, executor=executor)
+    assert np.array_equal(out[1], np.asarray(Image.open(images[1]))[3:7, 2:7])
+
+
+def test_decode_images_of_different_sizes(images):
+    shape, mode = output_shape(images[0])
+    with pytest.raises(ValueError):
+        decode_images(images, np.empty((len(images), *shape), dtype=np.uint8), mode)
+    out = decode_images(images, None, mode)
+    assert [sample.shape for sample in out] == [(10, 20, 3), (40, 30, 3), (10, 20, 3)]
+
+
+@pytest.mark.parametrize('labels, expected', [(['a', 'b'], ['a', 'b']), ([1, 2], [1, 2]),
+                                              (['a', None], ['a', '']), ([1, None], [1.0, np.nan])])
+def test_label_array_is_typed(labels, expected):
+    array = label_array(labels)
+    assert array.dtype != object
+    np.testing.assert_array_equal(array, np.asarray(expected))
+
+
+def test_label_manifest_keys_entries_by_relative_path(tmp_path):
+    (tmp_path / "labels.csv").write_text("name,label\n0/1.jpeg,a\n./1/1.jpeg,b\n2.jpeg,c\n3,d\n")
+    manifest = LabelManifest()
+    manifest.read(str(tmp_path / "labels.csv"))
+    assert [manifest.get(path) for path in ['0/1.jpeg', '1/1.jpeg', '0/2.jpeg', '0/3.jpeg']] == ['a', 'b', 'c', 'd']
+    assert manifest.report() is None
+    # A plain name cannot label images of different folders
+    assert manifest.get('1/2.jpeg') == 'c'
+    assert manifest.ambiguous == ['1/2.jpeg']
+
+
+def test_label_manifest_reports_missing_and_duplicate_entries(tmp_path):
+    (tmp_path / "labels.csv").write_text("name,label\n1.jpeg,a\n1.jpeg,b\n2,c\n")
+    manifest = LabelManifest()
+    manifest.read(str(tmp_path / "labels.csv"), prefix="0/")
+    manifest.read(str(tmp_path / "labels.csv"), prefix="1/")
+    assert manifest.get('1/2.jpeg') == 'c'
+    assert manifest.get('1/3.jpeg') is None
+    assert manifest.duplicates == ['0/1.jpeg', '1/1.jpeg']
+    assert manifest.missing == ['1/3.jpeg']
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from ImageNormalization.utils import channel_stats, to_sums, pooled_mean_std
+
+
+@pytest.fixture
+def clients():
+    rng = np.random.default_rng(0)
+    return [rng.normal(loc, 2, size=(n, 4, 4, 3)) for loc, n in [(0, 50), (5, 7), (-3, 120)]]
+
+
+@pytest.mark.parametrize('batch_size', [1, 16, 1024])
+def test_channel_stats_match_numpy(clients, batch_size):
+    count, mean, m2 = channel_stats(clients[0], batch_size)
+    values = clients[0].reshape(-1, 3)
+    assert count == len(values)
+    np.testing.assert_allclose(mean, values.mean(axis=0))
+    np.testing.assert_allclose(m2 / count, values.var(axis=0))
+
+
+def test_pooled_mean_std_of_aggregated_sums(clients):
+    sums = np.sum([to_sums(channel_stats(x, 32)) for x in clients], axis=0)
+    mean, std = pooled_mean_std(sums)
+    values = np.concatenate(clients).reshape(-1, 3)
+    np.testing.assert_allclose(mean, values.mean(axis=0))
+    np.testing.assert_allclose(std, values.std(axis=0))
+
+
+def test_pooled_mean_std_without_samples():
+    mean, std = pooled_mean_std(np.zeros((3, 3)))
+    assert mean.tolist() == [0, 0, 0] and std.tolist() == [0, 0, 0]
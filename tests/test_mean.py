@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import read_csv_chunks
+from Mean.utils import read_csv_stats, local_stats, split_stats
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    df = pd.DataFrame({'a': np.arange(10, dtype=float), 'b': list('xyzxyzxyzx'), 'c': [1, None] * 5})
+    file_name = tmp_path / "data.csv"
+    df.to_csv(file_name, index=False)
+    return str(file_name)
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 3, 100])
+def test_read_csv_stats_chunks_match_whole_file(csv_file, chunk_size):
+    sums, counts = read_csv_stats(csv_file, chunk_size)
+    assert sums.index.tolist() == ['a', 'c']
+    assert sums.tolist() == [45.0, 5.0]
+    assert counts.tolist() == [10, 5]
+
+
+def test_read_csv_stats_rejects_non_numeric_values_in_later_chunks(tmp_path):
+    file_name = tmp_path / "data.csv"
+    pd.DataFrame({'a': [1, 2, 3, 4, 'x', 6], 'b': [1] * 6}).to_csv(file_name, index=False)
+    with pytest.raises(ValueError, match="after row 4"):
+        read_csv_stats(str(file_name), chunk_size=2)
+
+
+@pytest.mark.parametrize('chunk_size', [None, 2])
+def test_split_stats_with_reader_options(tmp_path, chunk_size):
+    file_name = tmp_path / "data.csv"
+    pd.DataFrame({'a': [1.5, 3.5, 4.0], 'b': [3, 4, 5]}).to_csv(file_name, sep=';', index=False)
+    assert split_stats(str(file_name), 0, chunk_size, sep=';') == [[9.0, 12.0], [3, 3]]
+
+
+
+def test_read_csv_chunks_downcasts_each_chunk(tmp_path):
+    file_name = tmp_path / "data.csv"
+    pd.DataFrame({'a': [1.5, 3.5, 4.0], 'b': [3, 4, 5]}).to_csv(file_name, sep=';', index=False)
+    chunks = list(read_csv_chunks(str(file_name), 2, sep=';', float32=True))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    assert all(chunk.dtypes.tolist() == [np.float32, np.int64] for chunk in chunks)
+
+
+@pytest.mark.parametrize('reader', [{'engine': 'pyarrow'}, {'cache': True}])
+def test_read_csv_stats_rejects_options_that_do_not_apply_to_chunks(csv_file, reader):
+    with pytest.raises(ValueError):
+        read_csv_stats(csv_file, 2, **reader)
+
+
+def test_local_stats(csv_file):
+    sums, counts = read_csv_stats(csv_file)
+    assert local_stats(sums, counts, axis=None) == [50.0, 15]
+    assert local_stats(sums, counts, axis=0) == [[45.0, 5.0], [10, 5]]
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils import read_csv, write_csv, keep_in_memory, save_dataset, load_dataset, JsonSerializer, \
+    encode_fixed_point, decode_fixed_point, fixed_point_fits, choose_precision, encode_smpc, decode_smpc, MAX_PRECISION
+
+
+@pytest.mark.parametrize('labels, dtype', [(np.array(['a', 'b', 'a'], dtype=object), '<U1'),
+                                           (np.array([1, 2, 3], dtype=object), 'int64'),
+                                           ([0.5, 1.0, 2.0], 'float64'), (np.array([True, False, True]), 'bool')])
+def test_dataset_keeps_label_dtype(tmp_path, labels, dtype):
+    features = np.arange(12, dtype=np.uint8).reshape(3, 2, 2)
+    save_dataset(str(tmp_path / "data.npz"), features, labels)
+    loaded_features, loaded_labels, schema = load_dataset(str(tmp_path / "data.npz"), mmap_mode='r')
+    np.testing.assert_array_equal(loaded_features, features)
+    assert loaded_labels.dtype == np.dtype(dtype)
+    assert loaded_labels.tolist() == list(labels)
+    assert schema['n_samples'] == 3 and schema['feature_shape'] == [2, 2]
+
+
+@pytest.mark.parametrize('labels', [np.array([1, 'a', 2], dtype=object), ['a', None, 'b']])
+def test_dataset_rejects_mixed_labels(tmp_path, labels):
+    with pytest.raises(TypeError):
+        save_dataset(str(tmp_path / "data.npz"), np.zeros((3, 2)), labels)
+
+
+def test_flatten_and_unflatten_nested_data():
+    data = {'mean': [np.arange(6.).reshape(2, 3), 4, 2.5],
+            'frame': pd.DataFrame([[1.0, 2.0], [3.0, 4.0]], columns=['a', 'b'], index=[10, 20]),
+            'series': pd.Series([0.5, 1.5], index=['x', 'y'], name='s'),
+            'pair': (np.int64(3), np.float32(0.25))}
+    serializer = JsonSerializer()
+    vector, structure = serializer.flatten(data)
+    assert vector.dtype == np.float64 and vector.shape == (16,)
+    restored = serializer.unflatten(vector, structure)
+    np.testing.assert_array_equal(restored['mean'][0], data['mean'][0])
+    assert restored['mean'][1:] == [4, 2.5] and isinstance(restored['mean'][1], int)
+    pd.testing.assert_frame_equal(restored['frame'], data['frame'])
+    pd.testing.assert_series_equal(restored['series'], data['series'])
+    assert restored['pair'] == [3, 0.25]
+
+
+def test_flatten_lists_of_numbers_as_one_node():
+    serializer = JsonSerializer()
+    data = [[0.5, 1.5, 2.5], [1, 2, 3], [1, 2.5], [[1.0], [2, 3]]]
+    vector, structure = serializer.flatten(data)
+    assert structure[1][:2] == [['numbers', 3, 'float'], ['numbers', 3, 'int']]
+    assert structure[1][2] == ['list', [['int'], ['float']]]
+    restored = serializer.unflatten(vector, structure)
+    assert restored == data
+    assert [type(v) for v in restored[1] + restored[3][1]] == [int] * 5
+
+
+def test_unflatten_aggregated_vector():
+    serializer = JsonSerializer()
+    payloads = [serializer.flatten([np.full(3, i, dtype=float), i]) for i in range(1, 4)]
+    total = serializer.unflatten(np.sum([vector for vector, _ in payloads], axis=0), payloads[0][1])
+    assert total[0].tolist() == [6.0, 6.0, 6.0] and total[1] == 6
+
+
+def test_fixed_point_round_trip():
+    values = np.array([0.1234567, -2.5, 1e6, 0])
+    encoded = encode_fixed_point(values, precision=6, n_clients=3)
+    assert encoded.dtype == np.int64
+    assert encoded.tolist() == [123457, -2500000, 1000000000000, 0]
+    np.testing.assert_allclose(decode_fixed_point(encoded, 6), values, atol=5e-7)
+
+
+def test_fixed_point_sums_are_exact():
+    clients = [np.array([0.1, 0.2]), np.array([0.2, 0.7]), np.array([1e-6, -0.9])]
+    total = np.sum([encode_fixed_point(v, 6, len(clients)) for v in clients], axis=0)
+    assert decode_fixed_point(total, 6).tolist() == [0.300001, 0.0]
+
+
+def test_fixed_point_rejects_overflow_and_non_finite_values():
+    with pytest.raises(OverflowError):
+        encode_fixed_point([1e13], precision=6, n_clients=10)
+    with pytest.raises(ValueError):
+        encode_fixed_point([np.nan])
+
+
+def test_choose_precision_of_all_clients():
+    n_clients = 4
+    # Sums of int64 values of four clients stay below 2.3e18, i.e., 1e12 fits up to six decimal digits
+    fits = np.sum([fixed_point_fits(v, n_clients) for v in [[1.0], [-1e12], [0.5]]] + [[1] * 16], axis=0)
+    assert len(fits) == MAX_PRECISION + 1
+    assert choose_precision(fits.tolist(), n_clients) == 6
+    assert choose_precision(fixed_point_fits([1e19], 1), 1) is None
+
+
+@pytest.mark.parametrize('precision', [None, 4])
+def test_smpc_payload_round_trip(precision):
+    data = [np.array([[1.5, 2.25]]), 3]
+    payload, structure = encode_smpc(data, precision, n_clients=2)
+    aggregated = np.add(payload, payload)
+    restored = decode_smpc(aggregated, structure, precision)
+    assert restored[0].tolist() == [[3.0, 4.5]] and restored[1] == 6
+
+
+def test_read_csv_cache_is_keyed_by_engine(tmp_path, monkeypatch):
+    file_name = str(tmp_path / "data.csv")
+    pd.DataFrame({'a': [1.5, None], 'b': ['x', 'y']}).to_csv(file_name, index=False)
+    read_csv(file_name, cache=True)
+    parsed = []
+    monkeypatch.setattr(pd, 'read_csv', lambda *args, **kwargs: parsed.append(kwargs['engine']) or pd.DataFrame())
+    read_csv(file_name, cache=True)
+    read_csv(file_name, engine='python', cache=True)
+    assert parsed == ['python']
+
+
+def test_read_csv_in_memory_applies_dtype_and_float32(tmp_path):
+    file_name = str(tmp_path / "data.csv")
+    keep_in_memory()
+    try:
+        write_csv(pd.DataFrame({'a': [1.5, 2.5], 'b': [1, 2], 'c': ['x', 'y']}), file_name)
+    finally:
+        keep_in_memory(False)
+    df = read_csv(file_name, dtype={'b': 'float64'}, usecols=['a', 'b'], float32=True)
+    assert df.dtypes.tolist() == [np.float32, np.float32]
+    assert read_csv(file_name).dtypes.tolist()[:2] == [np.float64, np.int64]
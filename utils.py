@@ -1,33 +1,327 @@
+import hashlib
+import importlib.util
+import json
+import numbers
+import os
+import struct
+import sys
+import threading
+import traceback
+import zipfile
 import numpy as np
-import pandas as pd
 from FeatureCloud.app.engine.app import LogLevel, app
 from FeatureCloud.app.api.http_ctrl import api_server
 from FeatureCloud.app.api.http_web import web_server
-from bottle import Bottle
+from bottle import Bottle, request, abort
 
+# App names, as used in config files, and their packages
+APPS = {'cross_validation': 'CrossValidation',
+        'data_distributor': 'DataDistributor',
+        'image_loader': 'ImageLoader',
+        'image_normalization': 'ImageNormalization',
+        'mean': 'Mean'}
+DEFAULT_APP = 'mean'
+WORKFLOW = 'workflow'
+CONFIG_FILE = '/mnt/input/config.yml'
 
-def run(host='localhost', port=5000):
+# State of the background app registration
+_loader = {'thread': None, 'error': None, 'lock': threading.Lock()}
+
+
+def run(host='localhost', port=5000, app_name=None, config_file=CONFIG_FILE, profile=True):
     """ run the docker container on specific host and port.
+        The server comes up immediately, while the app is imported and registered in the background;
+        API requests are only answered once the app is registered. If the app cannot be selected
+        at startup, i.e., there is no config file yet, it will be selected once the setup request arrives.
 
     Parameters
     ----------
     host: str
     port: int
+    app_name: str
+        name of the app, e.g., `mean`, or its package, e.g., `Mean`.
+        By default, `FC_APP` environment variable or the config file determines the app.
+    config_file: str
+    profile: bool
+        whether to serve timing and memory records of executed states at `/profile`,
+        once profiling is enabled in the config of the app, i.e., `profile: true`.
 
     """
-
-    app.register()
+    if select_app(app_name, config_file) is not None:
+        _start_loader(app_name, config_file)
+    api_server.add_hook('before_request', lambda: _wait_for_app(app_name, config_file))
     server = Bottle()
     server.mount('/api', api_server)
     server.mount('/web', web_server)
+    if profile:
+        server.route('/profile', callback=_profile)
     server.run(host=host, port=port)
 
 
+def _profile():
+    from CustomStates.Profiler import profiler
+    if not profiler.enabled:
+        abort(404, "Profiling is not enabled; set `profile: true` in the config of the app.")
+    return {'states': profiler.records}
+
+
+def select_app(app_name=None, config_file=CONFIG_FILE):
+    """ Selects the app to run, in order of precedence: `app_name`, `FC_APP` environment variable,
+        and the config file: a `workflow` of several apps, if there is one, otherwise, the only app in the file.
+        Once the config file includes several apps without a workflow, the default app, i.e., Mean, is selected.
+
+    Parameters
+    ----------
+    app_name: str
+    config_file: str
+
+    Returns
+    -------
+    str or None
+        name of the app's package, or `workflow`; None, if the app cannot be selected yet.
+    """
+    app_name = app_name or os.environ.get('FC_APP', None)
+    if app_name is None and os.path.isfile(config_file):
+        import bios
+        config = bios.read(config_file)
+        apps = [key for key in config if key in APPS]
+        app_name = WORKFLOW if WORKFLOW in config else apps[0] if len(apps) == 1 else DEFAULT_APP
+    if app_name is None:
+        return None
+    return APPS.get(app_name, app_name)
+
+
+def register_app(app_name=None, config_file=CONFIG_FILE):
+    """ Imports the selected app, so that its states are registered, and registers the app.
+
+    Parameters
+    ----------
+    app_name: str
+    config_file: str
+    """
+    package = select_app(app_name, config_file) or APPS[DEFAULT_APP]
+    if package == WORKFLOW:
+        from workflow import register_workflow
+        register_workflow(config_file)
+    else:
+        importlib.import_module(f"{package}.app")
+    app.register()
+
+
+def _start_loader(app_name, config_file):
+    with _loader['lock']:
+        if _loader['thread'] is None:
+            _loader['thread'] = threading.Thread(target=_load_app, args=(app_name, config_file), daemon=True)
+            _loader['thread'].start()
+    return _loader['thread']
+
+
+def _load_app(app_name, config_file):
+    try:
+        register_app(app_name, config_file)
+    except Exception as e:
+        _loader['error'] = e
+        traceback.print_exc(file=sys.stderr)
+
+
+def _wait_for_app(app_name, config_file):
+    """ Blocks API requests until the app is registered. Before the setup request, there may be
+        no config file to select the app from; in that case, requests are answered right away.
+    """
+    if _loader['thread'] is None:
+        if not request.path.endswith('/setup') and select_app(app_name, config_file) is None:
+            return
+        _start_loader(app_name, config_file)
+    _loader['thread'].join()
+    if _loader['error'] is not None:
+        raise RuntimeError("The app could not be registered") from _loader['error']
+
+
+# Outputs that are kept in memory, by absolute path, to be handed to the next app of a workflow
+_memory = {'enabled': False, 'files': {}}
+
+
+def keep_in_memory(enabled=True):
+    """ Keeps files written by `save_numpy` and `write_csv` in memory instead of writing them, so that
+        `load_numpy` and `read_csv` can hand them to the next app in the same process without any I/O.
+
+    Parameters
+    ----------
+    enabled: bool
+        if False, files will be written again; kept files remain readable.
+    """
+    _memory['enabled'] = enabled
+
+
+def in_memory(file_name=None):
+    """ Checks whether outputs are kept in memory or, with `file_name`, whether the file is kept in memory.
+    """
+    if file_name is None:
+        return _memory['enabled']
+    return os.path.abspath(file_name) in _memory['files']
+
+
+def file_exists(file_name):
+    return in_memory(file_name) or os.path.isfile(file_name)
+
+
+def _remember(file_name, value):
+    _memory['files'][os.path.abspath(file_name)] = value
+
+
+def _recall(file_name):
+    return _memory['files'][os.path.abspath(file_name)]
+
+
+def write_csv(df, file_name, sep=','):
+    """ Writes a DataFrame as a CSV file without the index, or keeps it in memory; see `keep_in_memory`.
+    """
+    if _memory['enabled']:
+        _remember(file_name, df.copy())
+    else:
+        df.to_csv(file_name, sep=sep, index=False)
+
+
+def read_csv(file_name, sep=',', dtype=None, usecols=None, engine=None, float32=False, cache=False, cache_dir=None):
+    """ Reads a CSV file with the C engine, or another one, e.g., the multithreaded pyarrow engine,
+        and optional dtype hints.
+        Parsed datasets can be cached next to the input file in a binary format (Feather, or pickle without pyarrow),
+        keyed by path, modification time, size, and reading options, including the engine, so that re-reading
+        the same file skips parsing. Only the latest cache of each input file is kept.
+        Datasets that are kept in memory, e.g., in workflows, are only converted to `dtype` and `float32`.
+
+    Parameters
+    ----------
+    file_name: str
+    sep: str
+    dtype: dict or str
+        dtype of all or some columns
+    usecols: list
+        columns to be read
+    engine: str
+        `c` (default), `pyarrow`, or `python`; types and missing values are not inferred the same way
+        by all engines.
+    float32: bool
+        if True, float64 columns are downcasted to float32.
+    cache: bool
+        if True, the parsed dataset is cached.
+    cache_dir: str
+        directory of cached files; by default, the directory of the input file.
+
+    Returns
+    -------
+    df: pandas.DataFrame
+    """
+    import pandas as pd
+    if in_memory(file_name):
+        df = _recall(file_name).copy()
+        if usecols is not None:
+            df = df[usecols]
+        if dtype is not None:
+            df = df.astype(dtype)
+        return _to_float32(df) if float32 else df
+    cache_file = None
+    if cache:
+        stat = os.stat(file_name)
+        key = json.dumps([os.path.abspath(file_name), stat.st_mtime_ns, stat.st_size, sep, dtype, usecols, float32,
+                          engine or "c"], default=str)
+        key = hashlib.sha1(key.encode()).hexdigest()[:16]
+        ext = "feather" if _has_pyarrow() else "pkl"
+        cache_file = os.path.join(cache_dir or os.path.dirname(os.path.abspath(file_name)),
+                                  f".{os.path.basename(file_name)}.{key}.{ext}")
+        if os.path.exists(cache_file):
+            return pd.read_feather(cache_file) if ext == "feather" else pd.read_pickle(cache_file)
+    engine = engine or "c"
+    try:
+        df = pd.read_csv(file_name, sep=sep, dtype=dtype, usecols=usecols, engine=engine)
+    except ValueError:
+        if engine != "pyarrow":
+            raise
+        # Options that are not supported by the pyarrow engine, e.g., regular expression separators
+        df = pd.read_csv(file_name, sep=sep, dtype=dtype, usecols=usecols)
+    if float32:
+        df = _to_float32(df)
+    if cache_file is not None:
+        _write_cache(df, cache_file)
+    return df
+
+
+def read_csv_chunks(file_name, chunk_size, sep=',', dtype=None, usecols=None, engine=None, float32=False, cache=False,
+                    cache_dir=None):
+    """ Reads a CSV file in chunks of `chunk_size` rows with the same options as `read_csv`.
+        Options that cannot be applied to chunks, i.e., the pyarrow engine and caching, are rejected.
+
+    Returns
+    -------
+    iterator
+        pandas.DataFrame chunks
+
+    Raises
+    ------
+    ValueError
+        if `engine` is `pyarrow` or `cache` is True.
+    """
+    import pandas as pd
+    if engine == "pyarrow":
+        raise ValueError("CSV files cannot be read in chunks with the pyarrow engine; use the `c` or `python` engine, "
+                         "or read files at once")
+    if cache:
+        raise ValueError("CSV files that are read in chunks are not cached; turn off `cache`, or read files at once")
+    chunks = pd.read_csv(file_name, sep=sep, dtype=dtype, usecols=usecols, engine=engine or "c",
+                         chunksize=int(chunk_size))
+    return (_to_float32(chunk) if float32 else chunk for chunk in chunks)
+
+
+def _to_float32(df):
+    float64_columns = df.select_dtypes(include="float64").columns
+    df[float64_columns] = df[float64_columns].astype(np.float32)
+    return df
+
+
+def _write_cache(df, cache_file):
+    """ Writes a parsed dataset into the cache and removes previous caches of the same input file.
+        Datasets that cannot be cached, e.g., object columns of mixed types in Feather,
+        or cache directories that are not writable, are skipped.
+    """
+    tmp = f"{cache_file}.tmp"
+    try:
+        if cache_file.endswith("feather"):
+            df.to_feather(tmp)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, cache_file)
+    except (OSError, ValueError, TypeError):
+        # pyarrow errors, e.g., ArrowInvalid and ArrowTypeError, are ValueError and TypeError subclasses
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    cache_dir, name = os.path.split(cache_file)
+    input_name, key, _ = name.rsplit('.', 2)
+    for f in os.listdir(cache_dir):
+        parts = f.rsplit('.', 2)
+        if len(parts) == 3 and parts[0] == input_name and len(parts[1]) == len(key) and parts[2] in ['feather', 'pkl'] \
+                and f != name:
+            try:
+                os.remove(os.path.join(cache_dir, f))
+            except OSError:
+                pass
+
+
+def _has_pyarrow():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
 def save_numpy(file_name, features, labels, target):
     format = file_name.strip().split(".")[1].lower()
+    if _memory['enabled']:
+        return _remember_numpy(file_name, features, labels, target)
     save = {"npy": np.save, "npz": np.savez_compressed}
-    if target == "same-sep":
-        save[format](file_name, np.array([features, labels]))
+    if target == "same-sep" and format == "npz":
+        save_dataset(file_name, features, labels, target)
+    elif target == "same-sep":
+        ds = np.empty(2, dtype=object)
+        ds[0], ds[1] = features, labels
+        save[format](file_name, ds)
     elif target == "same-last":
         samples = [np.append(features[i], labels[i]) for i in range(features.shape[0])]
         save[format](file_name, samples)
@@ -41,15 +335,174 @@ def save_numpy(file_name, features, labels, target):
         return None
 
 
-def load_numpy(file_name):
-    ds = np.load(file_name, allow_pickle=True)
+def _remember_numpy(file_name, features, labels, target):
+    """ Keeps what `load_numpy` would return for the file written by `save_numpy` """
+    if target == "same-sep" and file_name.strip().split(".")[1].lower() == "npz":
+        _remember(file_name, (dense_array(features), np.asarray(labels)))
+    elif target == "same-sep":
+        ds = np.empty(2, dtype=object)
+        ds[0], ds[1] = features, labels
+        _remember(file_name, ds)
+    elif target == "same-last":
+        _remember(file_name, np.asarray([np.append(features[i], labels[i]) for i in range(features.shape[0])]))
+    elif target.strip().split(".")[1].lower() in ['npy', 'npz']:
+        _remember(file_name, np.asarray(features))
+        _remember(target, np.asarray(labels))
+
+
+def load_numpy(file_name, mmap_mode=None):
+    if in_memory(file_name):
+        return _recall(file_name)
     format = file_name.strip().split(".")[1].lower()
+    if format == "npz" and is_dataset(file_name):
+        features, labels, _ = load_dataset(file_name, mmap_mode)
+        return features, labels
+    if format == "npy" and mmap_mode is not None:
+        try:
+            return np.load(file_name, mmap_mode=mmap_mode)
+        except ValueError:
+            # Arrays of Python objects cannot be memory-mapped
+            pass
+    ds = np.load(file_name, allow_pickle=True)
     if format == "npz":
         return ds['arr_0']
     return ds
 
 
+def dense_array(values):
+    """ Converts a sequence of equally shaped samples (e.g., an object array or a list of arrays)
+        into a single dense NumPy array, without copying arrays that are already dense.
+
+    Parameters
+    ----------
+    values: array-like
+
+    Returns
+    -------
+    numpy.array
+    """
+    if isinstance(values, np.ndarray) and values.dtype != object:
+        return values
+    values = list(values)
+    if len(values) > 0 and isinstance(values[0], np.ndarray):
+        return np.stack(values)
+    return np.asarray(values)
+
+
+def save_dataset(file_name, features, labels=None, target="same-sep", compressed=False):
+    """ Saves a dataset as a `.npz` file with dense `features` and `labels` arrays and a small JSON schema.
+        No Python objects are pickled, and uncompressed files can be memory-mapped by `load_dataset`.
+
+    Parameters
+    ----------
+    file_name: str
+    features: array-like
+    labels: array-like
+    target: str
+        format of target values in the original data
+    compressed: bool
+        compressed files take less space, yet, they cannot be memory-mapped.
+
+    Raises
+    ------
+    TypeError
+        if labels cannot be stored in a typed array, e.g., labels of mixed types or None values.
+    """
+    features = dense_array(features)
+    arrays = {"features": features}
+    if labels is not None:
+        if not isinstance(labels, np.ndarray) or labels.dtype == object:
+            # NumPy would stringify mixed labels, which are not read back as the same values
+            kinds = {"str" if isinstance(label, (str, bytes)) else
+                     "number" if isinstance(label, (numbers.Number, np.bool_)) else type(label).__name__
+                     for label in labels}
+            if len(kinds) > 1 or not kinds <= {"str", "number"}:
+                raise TypeError(f"Labels of {', '.join(sorted(kinds))} types cannot be stored without pickling; "
+                                f"use labels of a single type, e.g., strings or numbers, or a `.npy` file.")
+        arrays["labels"] = dense_array(labels)
+    schema = {"format": "fc-dataset",
+              "version": 1,
+              "target": target,
+              "n_samples": int(features.shape[0]),
+              "feature_shape": list(features.shape[1:]),
+              "feature_dtype": features.dtype.str,
+              "label_dtype": arrays["labels"].dtype.str if labels is not None else None}
+    arrays["schema"] = np.frombuffer(json.dumps(schema).encode(), dtype=np.uint8)
+    save = np.savez_compressed if compressed else np.savez
+    with open(file_name, "wb") as f:
+        save(f, **arrays)
+
+
+def is_dataset(file_name):
+    """ Checks whether a `.npz` file is saved by `save_dataset`
+
+    Parameters
+    ----------
+    file_name: str
+
+    Returns
+    -------
+    bool
+    """
+    try:
+        with zipfile.ZipFile(file_name) as zf:
+            names = zf.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return False
+    return "schema.npy" in names and "features.npy" in names
+
+
+def load_dataset(file_name, mmap_mode=None):
+    """ Loads a dataset saved by `save_dataset` without unpickling.
+
+    Parameters
+    ----------
+    file_name: str
+    mmap_mode: str
+        if not None, arrays of uncompressed files are memory-mapped with this mode, e.g., 'r'.
+
+    Returns
+    -------
+    features: numpy.array
+    labels: numpy.array or None
+    schema: dict
+    """
+    arrays = {}
+    with np.load(file_name, allow_pickle=False) as npz:
+        for key in npz.files:
+            arrays[key] = _memmap_npz_member(file_name, key, mmap_mode) if mmap_mode else None
+            if arrays[key] is None:
+                arrays[key] = npz[key]
+    schema = json.loads(np.asarray(arrays["schema"]).tobytes().decode())
+    return arrays["features"], arrays.get("labels"), schema
+
+
+def _memmap_npz_member(file_name, key, mmap_mode):
+    """ Memory-maps an uncompressed array inside a `.npz` file; returns None if it is not possible.
+    """
+    with zipfile.ZipFile(file_name) as zf:
+        info = zf.getinfo(f"{key}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(file_name, "rb") as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype.hasobject:
+        return None
+    return np.memmap(file_name, dtype=dtype, mode=mmap_mode, shape=shape,
+                     order='F' if fortran_order else 'C', offset=offset)
+
+
 def sep_feat_from_label(ds, target):
+    import pandas as pd
     if target == 'same-sep':
         return pd.DataFrame({"features": [s for s in ds[0]], "label": ds[1]})
     elif target == 'same-last':
@@ -61,87 +514,355 @@ def sep_feat_from_label(ds, target):
         return None
 
 
-def log_clients_data(clients_data, log_func):
-    """ Logs the gathered data by the coordinator regarding the SMPC module and data type
+# Debug logs are only formatted when debug mode is on, i.e., `debug: true` in the config of the app
+_debug = {'enabled': False, 'sample': 3}
+
+
+def set_debug(enabled=True):
+    """ Turns debug logs of `log_data`, `log_send_data`, and `log_clients_data` on or off.
+    """
+    _debug['enabled'] = bool(enabled)
+
+
+def debug_enabled():
+    return _debug['enabled']
+
+
+def describe(data):
+    """ Describes data by its type, shape, dtype, and size without walking through its values.
+
+    Parameters
+    ----------
+    data: object
 
     Returns
     -------
+    str
+    """
+    name = type(data).__name__
+    if hasattr(data, 'dtypes') and hasattr(data, 'columns'):
+        return f"{name} shape={data.shape} nbytes={int(data.memory_usage(index=False).sum())}"
+    if hasattr(data, 'shape') and hasattr(data, 'dtype'):
+        return f"{name} shape={tuple(data.shape)} dtype={data.dtype} nbytes={data.nbytes}"
+    if isinstance(data, (str, bytes)):
+        return f"{name} len={len(data)}"
+    if hasattr(data, '__len__'):
+        return f"{name} len={len(data)}"
+    text = repr(data)
+    return f"{name} {text[:40] + '...' if len(text) > 40 else text}"
+
 
+def summarize(data, sample=None):
+    """ Summarizes data, and a bounded sample of its items, for debug logs; see `describe`.
+
+    Parameters
+    ----------
+    data: object
+    sample: int
+        number of items to be described; by default, three.
+
+    Returns
+    -------
+    str
+    """
+    sample = _debug['sample'] if sample is None else sample
+    lines = [describe(data)]
+    if isinstance(data, dict):
+        items = list(data.items())[:sample]
+    elif isinstance(data, (list, tuple)):
+        items = list(enumerate(data[:sample]))
+    else:
+        items = []
+    lines += [f"\t{k}: {describe(v)}" for k, v in items]
+    if hasattr(data, '__len__') and items and len(data) > sample:
+        lines.append(f"\t... {len(data) - sample} more")
+    return "\n".join(lines)
+
+
+def log_clients_data(clients_data, log_func):
+    """ Logs the gathered data by the coordinator regarding clients and data type, only in debug mode
     """
-    log_func("clients' data arrived", LogLevel.DEBUG)
-    log_func(f"Number of clients: {len(clients_data)}", LogLevel.DEBUG)
-    log_func("Recieved data from clients: Client_ID: type, length", LogLevel.DEBUG)
-    for client_data in clients_data:
-        log_func(f"\t{client_data[1]}: {type(client_data[0])},"
-                 f" {len(client_data[0]) if hasattr(client_data[0], '__len__') else 1}",
-                 LogLevel.DEBUG)
+    if not _debug['enabled']:
+        return
+    sample = "\n".join(f"\t{client}: {describe(data)}" for data, client in clients_data[:_debug['sample']])
+    log_func(f"clients' data arrived\nNumber of clients: {len(clients_data)}\n{sample}", LogLevel.DEBUG)
 
 
 def log_data(data, log_func):
-    """ logs the data based on its type, length, and value
+    """ Logs the data based on its type, shape, and size, only in debug mode
 
     Parameters
     ----------
-    data: str
-    title: str
+    data: object
+    log_func: callable
     """
-    log_func(f"Data:\n"
-             f"\tType: {type(data)}\n"
-             f"\tlength: {len(data)}", LogLevel.DEBUG)
-    for i, d in enumerate(data):
-        if hasattr(d, "__len__") and len(d) > 1:
-            log_func(f"\t{i}: Length= {len(d)}", LogLevel.DEBUG)
-        else:
-            log_func(f"\t{i}: Data= {d}", LogLevel.DEBUG)
+    if not _debug['enabled']:
+        return
+    log_func(f"Data: {summarize(data)}", LogLevel.DEBUG)
 
 
 def log_send_data(data, log_func):
-    """ Logs data in terms of legth, type, and value
+    """ Logs data that is being sent in terms of type, shape, and size, only in debug mode
 
-        Parameters
-        ----------
-        data: list
-        """
-    log_func(f"Sending data to coordinator", LogLevel.DEBUG)
-    log_func(f"Type: {type(data)}\n"
-             f"length: {len(data)}", LogLevel.DEBUG)
-    for i, d in enumerate(data[:3]):
-        if hasattr(d, '__len__'):
-            log_func(f"\t{i} >>> Length: {len(d)}", LogLevel.DEBUG)
-        else:
-            log_func(f"\t{i} >>> Data: {d}", LogLevel.DEBUG)
+    Parameters
+    ----------
+    data: object
+    log_func: callable
+    """
+    if not _debug['enabled']:
+        return
+    log_func(f"Sending data: {summarize(data)}", LogLevel.DEBUG)
 
 
 class JsonSerializer:
     """
     A serilizer to automatically convert all NumPy arrays, Panda DataFrames, and Pandas Series
     in a nested data structure into lists. All list, tuples, and dictionaries in the submitted data
-    will remain untouched
+    will remain untouched.
+    For SMPC payloads, numeric values of a nested data structure can be flattened into a single
+    dense vector and a structure descriptor, which can be used to restore the aggregated vector.
     """
 
     def __init__(self):
-        self.encoder = {pd.DataFrame: pd.DataFrame.to_numpy,
+        import pandas as pd
+        self.encoder = {pd.DataFrame: self.encode_frame,
                         pd.core.series.Series: pd.Series.tolist,
-                        np.ndarray: self.encode_numpy,
+                        np.ndarray: np.ndarray.tolist,
                         dict: self.encode_dict,
-                        list: self.encode_list}
+                        list: self.encode_list,
+                        tuple: self.encode_list}
 
     def prepare(self, data):
         if type(data) in self.encoder:
             return self.encoder[type(data)](data)
+        if isinstance(data, np.generic):
+            return data.item()
         return data
 
     def encode_list(self, data):
-        l = []
-        for item in data:
-            l.append(self.prepare(item))
-        return l
+        return [self.prepare(item) for item in data]
 
     def encode_dict(self, data):
         return {k: self.prepare(v) for k, v in data.items()}
 
-    def encode_numpy(self, data):
-        l = []
-        for item in data.to_list():
-            l.append(self.prepare(item))
-        return l
+    @staticmethod
+    def encode_frame(data):
+        return data.to_numpy().tolist()
+
+    def flatten(self, data):
+        """ Flattens numeric values of nested lists, tuples, dictionaries, NumPy arrays, Pandas Series,
+            and DataFrames into a single float64 vector in one pass.
+
+        Parameters
+        ----------
+        data: object
+
+        Returns
+        -------
+        vector: numpy.array
+        structure: list
+            JSON-serializable descriptor of the nested structure, shapes, and labels of the data
+        """
+        import pandas as pd
+        chunks = []
+
+        def walk(item):
+            if isinstance(item, (list, tuple)):
+                kind = _number_kind(item)
+                if kind is not None:
+                    # Lists of numbers, e.g., per-column statistics, are one chunk instead of one per value
+                    chunks.append(np.asarray(item, dtype=np.float64))
+                    return ['numbers', len(item), kind]
+                return ['list', [walk(i) for i in item]]
+            if isinstance(item, dict):
+                return ['dict', list(item.keys()), [walk(v) for v in item.values()]]
+            if isinstance(item, pd.DataFrame):
+                chunks.append(item.to_numpy(dtype=np.float64).ravel())
+                return ['frame', list(item.shape), self.prepare(item.columns.tolist()),
+                        self.prepare(item.index.tolist())]
+            if isinstance(item, pd.Series):
+                chunks.append(item.to_numpy(dtype=np.float64))
+                return ['series', len(item), self.prepare(item.index.tolist()), self.prepare(item.name)]
+            if isinstance(item, np.ndarray):
+                chunks.append(item.astype(np.float64, copy=False).ravel())
+                return ['array', list(item.shape)]
+            chunks.append(np.array([item], dtype=np.float64))
+            return ['int' if isinstance(item, (int, np.integer)) else 'float']
+
+        structure = walk(data)
+        vector = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float64)
+        return vector, structure
+
+    @staticmethod
+    def unflatten(vector, structure):
+        """ Restores the nested data structure of a flattened vector, e.g., after aggregation.
+
+        Parameters
+        ----------
+        vector: array-like
+        structure: list
+            descriptor returned by `flatten`
+
+        Returns
+        -------
+        object
+        """
+        import pandas as pd
+        vector = np.asarray(vector, dtype=np.float64)
+        offset = 0
+
+        def take(n):
+            nonlocal offset
+            offset += n
+            return vector[offset - n:offset]
+
+        def build(node):
+            kind = node[0]
+            if kind == 'list':
+                return [build(child) for child in node[1]]
+            if kind == 'dict':
+                return {k: build(child) for k, child in zip(node[1], node[2])}
+            if kind == 'frame':
+                shape = tuple(node[1])
+                return pd.DataFrame(take(shape[0] * shape[1]).reshape(shape), columns=node[2], index=node[3])
+            if kind == 'series':
+                return pd.Series(take(node[1]), index=node[2], name=node[3])
+            if kind == 'array':
+                shape = tuple(node[1])
+                return take(int(np.prod(shape))).reshape(shape)
+            if kind == 'numbers':
+                values = take(node[1])
+                return np.rint(values).astype(np.int64).tolist() if node[2] == 'int' else values.tolist()
+            value = take(1)[0]
+            return int(round(value)) if kind == 'int' else float(value)
+
+        return build(structure)
+
+
+def _number_kind(values):
+    """ `int` or `float` for non-empty flat lists of only integers or only floats; otherwise, None.
+    """
+    if len(values) == 0 or not isinstance(values[0], (numbers.Number, np.number)) or \
+            isinstance(values[0], (bool, np.bool_)):
+        return None
+    try:
+        array = np.asarray(values)
+    except ValueError:
+        # nested sequences after a number
+        return None
+    kind = array.dtype.kind if array.ndim == 1 else ''
+    if kind in 'iu':
+        return 'int'
+    if kind == 'f' and not any(isinstance(v, (int, np.integer)) for v in values):
+        return 'float'
+    return None
+
+
+# Decimal digits beyond float64 resolution carry no information
+MAX_PRECISION = 15
+
+
+def encode_fixed_point(values, precision=6, n_clients=1):
+    """ Converts float values into scaled int64 fixed-point values, so that they can be added exactly,
+        e.g., through SMPC. Values are checked to make sure the sum of `n_clients` such values cannot overflow.
+
+    Parameters
+    ----------
+    values: array-like
+    precision: int
+        number of decimal digits that are kept
+    n_clients: int
+        number of clients whose values will be added
+
+    Returns
+    -------
+    numpy.array
+        int64 values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        raise ValueError("Only finite values can be encoded as fixed-point values")
+    scaled = np.rint(values * 10.0 ** precision)
+    bound = np.iinfo(np.int64).max // max(int(n_clients), 1)
+    if scaled.size > 0 and np.abs(scaled).max() > bound:
+        raise OverflowError(f"Values up to {np.abs(values).max()} cannot be added over {n_clients} clients "
+                            f"with precision {precision} in int64; use a smaller or `auto` precision")
+    return scaled.astype(np.int64)
+
+
+def fixed_point_fits(values, n_clients=1, max_precision=MAX_PRECISION):
+    """ Checks, for each precision from zero to `max_precision`, whether values can be encoded as fixed-point values
+        without overflow when the values of `n_clients` clients are added; see `encode_fixed_point`.
+
+    Parameters
+    ----------
+    values: array-like
+    n_clients: int
+    max_precision: int
+
+    Returns
+    -------
+    list
+        1 for precisions that fit and 0 for the others, so that they can be added over clients
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        raise ValueError("Only finite values can be encoded as fixed-point values")
+    largest = np.abs(values).max() if values.size > 0 else 0.0
+    bound = np.iinfo(np.int64).max // max(int(n_clients), 1)
+    return [int(np.rint(largest * 10.0 ** p) <= bound) for p in range(max_precision + 1)]
+
+
+def choose_precision(fits, n_clients):
+    """ The largest precision at which values of all clients fit; see `fixed_point_fits`.
+
+    Parameters
+    ----------
+    fits: list
+        sum of `fixed_point_fits` of all clients
+    n_clients: int
+
+    Returns
+    -------
+    int or None
+        None, if values of some clients are too large for any precision.
+    """
+    precisions = [p for p, n in enumerate(fits) if round(n) == n_clients]
+    return max(precisions) if precisions else None
+
+
+def decode_fixed_point(values, precision=6):
+    """ Converts (aggregated) fixed-point values back into floats; see `encode_fixed_point`.
+    """
+    return np.asarray(values, dtype=np.float64) / 10.0 ** precision
+
+
+def encode_smpc(data, precision=None, n_clients=1):
+    """ Prepares a nested data structure for SMPC aggregation as a single flat vector.
+
+    Parameters
+    ----------
+    data: object
+        nested lists, dictionaries, NumPy arrays, and Pandas Series and DataFrames of numbers
+    precision: int
+        if given, values are encoded as int64 fixed-point values with `precision` decimal digits.
+    n_clients: int
+
+    Returns
+    -------
+    payload: list
+    structure: list
+        descriptor of the data structure, which is required to decode the aggregated payload.
+    """
+    vector, structure = JsonSerializer().flatten(data)
+    if precision is not None:
+        vector = encode_fixed_point(vector, precision, n_clients)
+    return vector.tolist(), structure
+
+
+def decode_smpc(aggregated, structure, precision=None):
+    """ Restores the data structure of an aggregated SMPC payload; see `encode_smpc`.
+    """
+    if precision is not None:
+        aggregated = decode_fixed_point(aggregated, precision)
+    return JsonSerializer.unflatten(aggregated, structure)
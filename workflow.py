@@ -0,0 +1,143 @@
+"""
+    Running several companion apps, one after another, in a single container.
+
+    The `workflow` part of the config file lists the apps in order of execution:
+        workflow:
+          apps: [image_loader, data_distributor, cross_validation, image_normalization]
+          in_memory: true
+
+    States of all apps are registered in the same FeatureCloud app; the terminal state of each app
+    is replaced by the initial state of the next one. Each app reads the outputs of the previous one
+    from its output directory, `<output_dir>/workflow/<index>_<app>`, and the last app writes into the output directory.
+    With `in_memory`, NumPy and CSV outputs of all apps except the last one are handed to the next app in memory
+    instead of being written and read again.
+"""
+import importlib
+import os
+import sys
+import bios
+from FeatureCloud.app.engine import app as engine
+from CustomStates.ConfigState import State as ConfigState
+import utils
+
+
+class StageApp:
+    """ View of the main app for states of one app in the workflow.
+        Everything is forwarded to the main app, except transitions, whose targets are resolved
+        inside the same app, and the internal dictionary, which is separate for each app.
+
+    Attributes
+    ----------
+    main: FeatureCloud.app.engine.app.App
+    prefix: str
+        prefix of state names of the app
+    initial: str
+        name of the app's initial state
+    next_state: str
+        name of the state after the app is done, i.e., the initial state of the next app or `terminal`
+    internal: dict
+    """
+
+    def __init__(self, main, prefix, initial, next_state):
+        object.__setattr__(self, 'main', main)
+        object.__setattr__(self, 'prefix', prefix)
+        object.__setattr__(self, 'initial', initial)
+        object.__setattr__(self, 'next_state', next_state)
+        object.__setattr__(self, 'internal', {})
+
+    def __getattr__(self, name):
+        return getattr(self.main, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.main, name, value)
+
+    def state_name(self, name):
+        if name == 'initial':
+            return self.initial
+        if name == 'terminal':
+            return self.next_state
+        return f"{self.prefix}.{name}"
+
+    def register_transition(self, name, source, target, participant=True, coordinator=True):
+        self.main.register_transition(name, source, self.state_name(target), participant, coordinator)
+
+
+def stage_dirs(apps, input_dir, output_dir):
+    """ Input and output directories of apps in the workflow: each app reads the outputs of the previous one.
+
+    Returns
+    -------
+    list
+        (input_dir, output_dir) for each app
+    """
+    dirs = []
+    for i, app_name in enumerate(apps):
+        stage_output = output_dir if i == len(apps) - 1 else f"{output_dir}/workflow/{i}_{app_name}"
+        dirs.append((input_dir, stage_output))
+        input_dir = stage_output
+    return dirs
+
+
+def register_workflow(config_file=utils.CONFIG_FILE, input_dir=None, output_dir="/mnt/output"):
+    """ Registers states of all apps in the workflow into the main app.
+        Each app package is imported while a fresh app is in place, so that its states
+        do not collide with states of other apps, and then its states are moved into the main app.
+
+    Parameters
+    ----------
+    config_file: str
+    input_dir: str
+        by default, the directory of the config file.
+    output_dir: str
+    """
+    input_dir = input_dir or os.path.dirname(config_file)
+    config = bios.read(config_file)[utils.WORKFLOW]
+    apps = config['apps']
+    main = engine.app
+    dirs = stage_dirs(apps, input_dir, output_dir)
+    for i, app_name in enumerate(apps):
+        initial = 'initial' if i == 0 else f"{i}.{app_name}.initial"
+        next_state = 'terminal' if i == len(apps) - 1 else f"{i + 1}.{apps[i + 1]}.initial"
+        stage = StageApp(main, f"{i}.{app_name}", initial, next_state)
+        for name, state in import_states(utils.APPS.get(app_name, app_name)).items():
+            if name == 'terminal':
+                continue
+            state.name = stage.state_name(name)
+            state._app = stage
+            if isinstance(state, ConfigState):
+                state.input_dir, state.output_dir = dirs[i]
+                state.config_file = f"{state.input_dir}/config.yml"
+            if name == 'initial':
+                state.run = start_stage(state.run, config.get('in_memory', False) and i < len(apps) - 1)
+            main.states[state.name] = state
+        os.makedirs(dirs[i][1], exist_ok=True)
+
+
+def start_stage(run, in_memory):
+    """ Wraps the `run` method of the initial state of an app to keep its outputs in memory, or write them.
+    """
+    def start():
+        utils.keep_in_memory(in_memory)
+        return run()
+    return start
+
+
+def import_states(package):
+    """ Imports, or re-imports, the app of a package with a fresh app in place.
+
+    Returns
+    -------
+    dict
+        states of the app by name
+    """
+    main = engine.app
+    engine.app = engine.App()
+    try:
+        module = sys.modules.get(f"{package}.app", None)
+        if module is None:
+            importlib.import_module(f"{package}.app")
+        else:
+            importlib.reload(module)
+        return engine.app.states
+    finally:
+        engine.app = main